@@ -0,0 +1,141 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from hedging import hedged_call
+from vector_index import document_id
+
+# Answers are always memoized for the run; DEEPEVAL_PERSIST_ANSWERS=1 also
+# keeps them in ANSWER_CACHE_PATH so later runs skip the LLM entirely
+PERSIST_ANSWERS = os.environ.get("DEEPEVAL_PERSIST_ANSWERS", "0") == "1"
+ANSWER_CACHE_PATH = os.environ.get("DEEPEVAL_ANSWER_CACHE", ".answer_cache.sqlite")
+
+# Answers answer_all() generates at once; the rate limiter still paces the requests
+ANSWER_CONCURRENCY = int(os.environ.get("DEEPEVAL_ANSWER_CONCURRENCY", "8"))
+
+_answers = {}
+_stats = {"hits": 0, "generated": 0}
+_lock = threading.Lock()
+_connection = None
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(ANSWER_CACHE_PATH, check_same_thread=False)
+        _connection.execute("CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, answer TEXT)")
+    return _connection
+
+
+def answer_key(llm_chain, question, documents):
+    llm = llm_chain.llm
+    payload = {
+        "prompt": llm_chain.prompt.template,
+        "model": getattr(llm, "model_name", None) or getattr(llm, "model", None),
+        "chunks": [document_id(document) for document in documents],
+        "query": question,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def lookup(key):
+    with _lock:
+        if key in _answers:
+            return _answers[key]
+        if PERSIST_ANSWERS:
+            row = _db().execute("SELECT answer FROM answers WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                _answers[key] = row[0]
+                return row[0]
+    return None
+
+
+def store(key, answer):
+    with _lock:
+        _answers[key] = answer
+        if PERSIST_ANSWERS:
+            _db().execute("INSERT OR REPLACE INTO answers VALUES (?, ?)", (key, answer))
+            _db().commit()
+
+
+def _generate(chain, question, documents):
+    key = answer_key(chain.combine_documents_chain.llm_chain, question, documents)
+    cached = lookup(key)
+    if cached is not None:
+        with _lock:
+            _stats["hits"] += 1
+        return cached
+
+    # What RetrievalQA runs after retrieval, so the documents are not fetched twice
+    result = hedged_call(chain.combine_documents_chain.run, input_documents=documents, question=question)
+    store(key, result)
+    with _lock:
+        _stats["generated"] += 1
+    return result
+
+
+def _question(chain, query):
+    return query[chain.input_key] if isinstance(query, dict) else query
+
+
+def _memoizable(chain):
+    # Sampled answers are not reproducible, there is nothing to memoize
+    return getattr(chain.combine_documents_chain.llm_chain.llm, "temperature", None) == 0
+
+
+def answer(chain, query):
+    # Drop-in for hedged_call(chain.run, query) on a RetrievalQA chain; query is
+    # the question or a {"query": ...} dict like chain.run takes
+    if not _memoizable(chain):
+        return hedged_call(chain.run, query)
+    question = _question(chain, query)
+    # The key covers what was retrieved, so re-indexing the PDF invalidates it
+    return _generate(chain, question, chain.retriever.get_relevant_documents(question))
+
+
+def retrieve_all(retriever, questions):
+    # Documents for every question from one embedding request and one FAISS
+    # search, the same ones retriever.get_relevant_documents returns one by one
+    vectorstore = retriever.vectorstore
+    plain = (
+        retriever.search_type == "similarity"
+        and set(retriever.search_kwargs) <= {"k"}
+        and not getattr(vectorstore, "_normalize_L2", False)
+        # Older FAISS wrappers only keep the embed_query function
+        and getattr(vectorstore, "embeddings", None) is not None
+    )
+    if not plain:
+        return [retriever.get_relevant_documents(question) for question in questions]
+    # OpenAI embeds a query exactly like a one-text document batch
+    vectors = np.asarray(vectorstore.embeddings.embed_documents(questions), dtype=np.float32)
+    _, indices = vectorstore.index.search(vectors, retriever.search_kwargs.get("k", 4))
+    return [
+        [vectorstore.docstore.search(vectorstore.index_to_docstore_id[index]) for index in row if index != -1]
+        for row in indices
+    ]
+
+
+def answer_all(chain, queries):
+    # answer() for a whole dataset: retrieval is batched and up to
+    # ANSWER_CONCURRENCY answers are generated at a time. Answers come back in
+    # the order of queries, and repeated questions are only generated once.
+    if not _memoizable(chain):
+        with concurrent.futures.ThreadPoolExecutor(ANSWER_CONCURRENCY) as executor:
+            return list(executor.map(lambda query: hedged_call(chain.run, query), queries))
+    questions = [_question(chain, query) for query in queries]
+    unique = list(dict.fromkeys(questions))
+    documents = retrieve_all(chain.retriever, unique)
+    with concurrent.futures.ThreadPoolExecutor(ANSWER_CONCURRENCY) as executor:
+        answers = dict(zip(unique, executor.map(lambda pair: _generate(chain, *pair), zip(unique, documents))))
+    return [answers[question] for question in questions]
+
+
+def print_answer_cache_summary():
+    with _lock:
+        stats = dict(_stats)
+    print(f"Answer cache: {stats['hits']} hits, {stats['generated']} answers generated")
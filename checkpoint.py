@@ -0,0 +1,113 @@
+import glob
+import json
+import os
+import shutil
+import sys
+import threading
+
+from deepeval import assert_test
+
+from incremental import entry_key, entry_hash
+
+CHECKPOINT_DIR = os.environ.get("DEEPEVAL_CHECKPOINT_DIR", ".eval_checkpoint")
+
+# `python hell.py --resume`, `pytest test_Main.py --resume` (see conftest.py) or DEEPEVAL_RESUME=1
+RESUME = "--resume" in sys.argv or os.environ.get("DEEPEVAL_RESUME", "0") == "1"
+
+# Checkpoints live in CHECKPOINT_DIR/<namespace>/, so a script starting fresh only
+# clears its own. pytest runs (assert_test_resumable, conftest.py) share PYTEST_NAMESPACE.
+PYTEST_NAMESPACE = "pytest"
+
+_lock = threading.Lock()
+
+
+def script_namespace():
+    # The running script's name, e.g. "hell" for `python hell.py`
+    return os.path.splitext(os.path.basename(sys.argv[0]))[0] or "main"
+
+
+def pair_key(test_case, metric):
+    # The entry hash covers the test case's fields, so an edited entry is judged again
+    return f"{entry_key(test_case)}|{entry_hash(test_case, [metric])}"
+
+
+def _checkpoint_dir(namespace):
+    return os.path.join(CHECKPOINT_DIR, namespace)
+
+
+def _checkpoint_file(namespace):
+    # One file per xdist worker so concurrent appends never interleave
+    worker = os.environ.get("PYTEST_XDIST_WORKER", "main")
+    return os.path.join(_checkpoint_dir(namespace), f"{worker}.jsonl")
+
+
+def save_pair(test_case, metric, namespace=PYTEST_NAMESPACE):
+    # Appended and flushed as soon as the metric finishes, so a crash loses at most the calls in flight
+    record = {
+        "key": pair_key(test_case, metric),
+        "score": metric.score,
+        "reason": metric.reason,
+        "success": getattr(metric, "success", None),
+    }
+    with _lock:
+        os.makedirs(_checkpoint_dir(namespace), exist_ok=True)
+        with open(_checkpoint_file(namespace), "a") as file:
+            file.write(json.dumps(record, default=str) + "\n")
+
+
+def load_checkpoint(namespace=PYTEST_NAMESPACE):
+    finished = {}
+    for path in glob.glob(os.path.join(_checkpoint_dir(namespace), "*.jsonl")):
+        with open(path) as file:
+            for line in file:
+                # The last line can be cut short if the run was killed mid-write
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                finished[record["key"]] = record
+    return finished
+
+
+def clear_checkpoint(namespace=PYTEST_NAMESPACE):
+    shutil.rmtree(_checkpoint_dir(namespace), ignore_errors=True)
+
+
+def restore(metric, record):
+    metric.score = record["score"]
+    metric.reason = record["reason"]
+    metric.success = record["success"]
+
+
+def restore_finished(test_case, metrics, finished):
+    # Restores the pairs an interrupted run already finished and returns the rest
+    pending = []
+    for metric in metrics:
+        record = finished.get(pair_key(test_case, metric))
+        if record is None:
+            pending.append(metric)
+        else:
+            restore(metric, record)
+    return pending
+
+
+_finished = None
+
+
+def assert_test_resumable(test_case, metrics):
+    # assert_test, except that with --resume pairs from the checkpoint are not judged again
+    global _finished
+    if _finished is None:
+        _finished = load_checkpoint() if RESUME else {}
+    pending = restore_finished(test_case, metrics, _finished)
+    try:
+        if pending:
+            assert_test(test_case, pending)
+    finally:
+        for metric in pending:
+            if metric.score is not None:
+                save_pair(test_case, metric)
+
+    failed = [metric.__class__.__name__ for metric in metrics if metric not in pending and not metric.success]
+    if failed:
+        raise AssertionError(f"Metrics {', '.join(failed)} failed (restored from checkpoint)")
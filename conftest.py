@@ -0,0 +1,57 @@
+import os
+
+import deepeval
+import pytest
+
+from checkpoint import clear_checkpoint
+from result_collector import (
+    clear_results, write_shard, load_shards, iter_entries, recorded_modules, import_for_report
+)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--resume",
+        action="store_true",
+        help="skip (test case, metric) pairs finished by an interrupted run",
+    )
+
+
+def pytest_configure(config):
+    # xdist workers inherit the environment, so they resume too
+    if config.getoption("--resume"):
+        os.environ["DEEPEVAL_RESUME"] = "1"
+
+
+def _is_xdist_controller(config):
+    return not hasattr(config, "workerinput") and bool(getattr(config.option, "numprocesses", None))
+
+
+def pytest_sessionstart(session):
+    # Runs before xdist spawns workers, so results from an earlier run never leak in.
+    # Resumed runs start over too: restored pairs are recorded again from the checkpoint.
+    if not hasattr(session.config, "workerinput"):
+        clear_results()
+        if not session.config.getoption("--resume"):
+            clear_checkpoint()
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_sessionfinish(session):
+    # deepeval only runs on_test_run_end in the process that started the run,
+    # never in xdist workers, so each worker writes its shard from here
+    if hasattr(session.config, "workerinput"):
+        write_shard()
+        return
+    # Every worker has finished by now; build one consolidated report per test module
+    if not _is_xdist_controller(session.config):
+        return
+    load_shards()
+    for report_module in recorded_modules():
+        print(f"Merged {sum(1 for _ in iter_entries(report_module))} {report_module} results from xdist workers")
+        # The module's on_test_run_end hook now sees all of its rows, as in a single process
+        module = import_for_report(report_module)
+        module.function_to_be_called_after_test_run()
+    # Importing the modules registered their hooks; `deepeval test run` would
+    # otherwise run the last one again once pytest returns
+    deepeval.on_test_run_end(lambda: None)
@@ -0,0 +1,214 @@
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from deepeval.metrics import HallucinationMetric
+
+from judge import generate, a_generate, load_json
+from metric_cache import judge_model
+from metric_directions import metric_passes
+
+# Off by default; DEEPEVAL_CONTEXT_VERDICT_STORE=1 replaces deepeval's
+# HallucinationMetric judging with per-context-sentence verdicts reused across runs
+CONTEXT_VERDICTS = os.environ.get("DEEPEVAL_CONTEXT_VERDICT_STORE", "0") == "1"
+STORE_PATH = os.environ.get("DEEPEVAL_CONTEXT_VERDICTS", ".context_verdicts.sqlite")
+
+# Judge requests tried before falling back to deepeval's own HallucinationMetric
+JUDGE_ATTEMPTS = 2
+
+_stats = {"reused": 0, "judged": 0, "requests": 0, "fallbacks": 0}
+# Set while deepeval's own measure runs, so the a_measure it drives is not intercepted again
+_falling_back = contextvars.ContextVar("context_verdicts_falling_back", default=False)
+_lock = threading.Lock()
+_connection = None
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(STORE_PATH, check_same_thread=False)
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS context_verdicts (key TEXT PRIMARY KEY, verdict TEXT, reason TEXT)"
+        )
+    return _connection
+
+
+def verdict_key(model, context, actual_output):
+    payload = json.dumps([model, context, actual_output])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def lookup_verdicts(model, contexts, actual_output):
+    # context sentence -> (verdict, reason) for every pair judged before
+    found = {}
+    with _lock:
+        for context in contexts:
+            row = _db().execute(
+                "SELECT verdict, reason FROM context_verdicts WHERE key = ?",
+                (verdict_key(model, context, actual_output),),
+            ).fetchone()
+            if row is not None:
+                found[context] = row
+    return found
+
+
+def store_verdicts(model, actual_output, verdicts):
+    with _lock:
+        _db().executemany(
+            "INSERT OR REPLACE INTO context_verdicts VALUES (?, ?, ?)",
+            [
+                (verdict_key(model, context, actual_output), verdict, reason)
+                for context, (verdict, reason) in verdicts.items()
+            ],
+        )
+        _db().commit()
+
+
+def build_prompt(contexts, actual_output):
+    # Every unjudged context sentence of one output goes into a single request
+    return f"""For each context below, in order, decide whether the Actual Output agrees with it.
+Answer 'yes' if it agrees or does not contradict it, 'no' if it contradicts it.
+
+Actual Output:
+{actual_output}
+
+Contexts:
+{json.dumps(contexts, indent=2)}
+
+Return only a JSON object with a "verdicts" list holding one
+{{"verdict": "yes" or "no", "reason": "<one sentence>"}} object per context, in order.
+
+JSON:
+"""
+
+
+def _apply(metric, contexts, verdicts):
+    contradicted = [context for context in contexts if verdicts[context][0].strip().lower() == "no"]
+    metric.score = len(contradicted) / len(contexts) if contexts else 0
+    metric.success = metric_passes(metric)
+    if not getattr(metric, "include_reason", True):
+        metric.reason = None
+    elif contradicted:
+        metric.reason = (
+            f"The score is {metric.score:.2f} because the output contradicts: "
+            + " ".join(verdicts[context][1] for context in contradicted)
+        )
+    else:
+        metric.reason = f"The score is {metric.score:.2f} because the output agrees with every context."
+
+
+def _split(metric, test_case):
+    contexts = list(test_case.context or [])
+    model = judge_model(metric)
+    verdicts = lookup_verdicts(model, contexts, test_case.actual_output)
+    missing = [context for context in dict.fromkeys(contexts) if context not in verdicts]
+    with _lock:
+        _stats["reused"] += len(contexts) - len(missing)
+        _stats["judged"] += len(missing)
+        _stats["requests"] += bool(missing)
+    return contexts, model, verdicts, missing
+
+
+def _record(model, test_case, verdicts, missing, output):
+    # False when the judge's answer cannot be matched to the contexts it was asked about
+    try:
+        judged = load_json(output).get("verdicts", [])
+    except (ValueError, AttributeError):
+        return False
+    if not isinstance(judged, list) or len(judged) != len(missing):
+        return False
+    if not all(isinstance(verdict, dict) for verdict in judged):
+        return False
+    new = {
+        context: (verdict.get("verdict", "yes"), verdict.get("reason", ""))
+        for context, verdict in zip(missing, judged)
+    }
+    store_verdicts(model, test_case.actual_output, new)
+    verdicts.update(new)
+    return True
+
+
+def measure_hallucination(metric, test_case):
+    # None when the judge never answered in the expected shape
+    contexts, model, verdicts, missing = _split(metric, test_case)
+    for _ in range(JUDGE_ATTEMPTS if missing else 0):
+        if _record(model, test_case, verdicts, missing, generate(metric, build_prompt(missing, test_case.actual_output))):
+            break
+    else:
+        if missing:
+            return None
+    _apply(metric, contexts, verdicts)
+    return metric.score
+
+
+async def a_measure_hallucination(metric, test_case):
+    contexts, model, verdicts, missing = _split(metric, test_case)
+    for _ in range(JUDGE_ATTEMPTS if missing else 0):
+        output = await a_generate(metric, build_prompt(missing, test_case.actual_output))
+        if _record(model, test_case, verdicts, missing, output):
+            break
+    else:
+        if missing:
+            return None
+    _apply(metric, contexts, verdicts)
+    return metric.score
+
+
+def _count_fallback():
+    with _lock:
+        _stats["fallbacks"] += 1
+
+
+def install_context_verdict_store():
+    # Must run before metric_cache.install_verdict_cache() so the whole-metric
+    # cache still sits in front of the per-sentence store. Every test module
+    # installs both at import, so later calls are no-ops.
+    if getattr(HallucinationMetric, "_context_verdicts_installed", False):
+        return
+    if getattr(HallucinationMetric, "_verdict_cache_installed", False):
+        raise RuntimeError("install_context_verdict_store() must be called before install_verdict_cache()")
+    original_measure = HallucinationMetric.measure
+    original_a_measure = HallucinationMetric.a_measure
+
+    @functools.wraps(original_measure)
+    def measure(self, test_case, *args, **kwargs):
+        if not _falling_back.get():
+            score = measure_hallucination(self, test_case)
+            if score is not None:
+                return score
+            _count_fallback()
+        token = _falling_back.set(True)
+        try:
+            return original_measure(self, test_case, *args, **kwargs)
+        finally:
+            _falling_back.reset(token)
+
+    @functools.wraps(original_a_measure)
+    async def a_measure(self, test_case, *args, **kwargs):
+        if not _falling_back.get():
+            score = await a_measure_hallucination(self, test_case)
+            if score is not None:
+                return score
+            _count_fallback()
+        token = _falling_back.set(True)
+        try:
+            return await original_a_measure(self, test_case, *args, **kwargs)
+        finally:
+            _falling_back.reset(token)
+
+    HallucinationMetric.measure = measure
+    HallucinationMetric.a_measure = a_measure
+    HallucinationMetric._context_verdicts_installed = True
+
+
+def print_context_verdict_summary():
+    with _lock:
+        stats = dict(_stats)
+    print(
+        f"Context verdicts: {stats['reused']} reused, {stats['judged']} judged "
+        f"in {stats['requests']} requests, {stats['fallbacks']} fell back to deepeval's judge"
+    )
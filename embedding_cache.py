@@ -0,0 +1,146 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Vectors live in one append-only float32 file per model ("<model hash>.f32"),
+# memory-mapped for reading; index.sqlite maps (model, text hash) to a row of it
+CACHE_DIR = os.environ.get("DEEPEVAL_EMBEDDING_CACHE", ".embedding_cache")
+
+_stats = {"hits": 0, "misses": 0}
+_lock = threading.Lock()
+_connection = None
+# model -> read-only memmap of its committed rows
+_maps = {}
+
+
+def embedding_model(embeddings):
+    # A CachedEmbeddings wrapper produces the vectors of the model it wraps
+    embeddings = getattr(embeddings, "embeddings", embeddings)
+    return f"{type(embeddings).__name__}:{getattr(embeddings, 'model', None)}"
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Autocommit, so writers can take the lock explicitly with BEGIN IMMEDIATE
+        _connection = sqlite3.connect(
+            os.path.join(CACHE_DIR, "index.sqlite"), check_same_thread=False, isolation_level=None
+        )
+        # WAL lets other processes keep reading while one appends
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS models (model TEXT PRIMARY KEY, dimension INTEGER, rows INTEGER)"
+        )
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            "model TEXT, text_hash TEXT, row INTEGER, PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+        )
+    return _connection
+
+
+def _vector_path(model):
+    return os.path.join(CACHE_DIR, hashlib.sha256(model.encode("utf-8")).hexdigest()[:16] + ".f32")
+
+
+def _rows(model, hashes):
+    # text hash -> row for every hash already stored
+    found = {}
+    for start in range(0, len(hashes), 500):
+        batch = hashes[start:start + 500]
+        found.update(_db().execute(
+            f"SELECT text_hash, row FROM vectors WHERE model = ? AND text_hash IN ({', '.join('?' * len(batch))})",
+            (model, *batch),
+        ).fetchall())
+    return found
+
+
+def _store(model, hashes, vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    connection = _db()
+    # Serializes writers across processes: rows are handed out and the index
+    # updated in one transaction, after the vectors themselves are on disk
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        # Another process may have stored some of these texts meanwhile
+        stored = _rows(model, hashes)
+        new = [index for index, key in enumerate(hashes) if key not in stored]
+        meta = connection.execute("SELECT dimension, rows FROM models WHERE model = ?", (model,)).fetchone()
+        count = meta[1] if meta else 0
+        if new:
+            # Written at the committed end, overwriting whatever a crashed writer left past it
+            with open(_vector_path(model), "r+b" if meta else "wb") as file:
+                file.seek(count * vectors.shape[1] * 4)
+                file.write(vectors[new].tobytes())
+            connection.executemany(
+                "INSERT INTO vectors VALUES (?, ?, ?)",
+                [(model, hashes[index], count + offset) for offset, index in enumerate(new)],
+            )
+            connection.execute(
+                "INSERT OR REPLACE INTO models VALUES (?, ?, ?)", (model, vectors.shape[1], count + len(new))
+            )
+            stored.update((hashes[index], count + offset) for offset, index in enumerate(new))
+        connection.execute("COMMIT")
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    return stored
+
+
+def _vectors(model, needed):
+    # Remapped only when a row past the current map is needed
+    vectors = _maps.get(model)
+    if vectors is None or needed > len(vectors):
+        dimension, rows = _db().execute("SELECT dimension, rows FROM models WHERE model = ?", (model,)).fetchone()
+        vectors = np.memmap(_vector_path(model), dtype=np.float32, mode="r", shape=(rows, dimension))
+        _maps[model] = vectors
+    return vectors
+
+
+class CachedEmbeddings(Embeddings):
+    # Wraps an embeddings model so each distinct text is only ever embedded once;
+    # the vectors it returns are rows of the memory-mapped store, not copies
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", None)
+
+    def _embed(self, namespace, texts, embed):
+        hashes = [text_hash(text) for text in texts]
+        with _lock:
+            rows = _rows(namespace, hashes)
+        missing = {key: text for key, text in zip(hashes, texts) if key not in rows}
+        with _lock:
+            _stats["hits"] += len(hashes) - len(missing)
+            _stats["misses"] += len(missing)
+        if missing:
+            vectors = embed(list(missing.values()))
+            with _lock:
+                rows.update(_store(namespace, list(missing), vectors))
+        if not hashes:
+            return []
+        with _lock:
+            vectors = _vectors(namespace, max(rows.values()) + 1)
+        return [vectors[rows[key]] for key in hashes]
+
+    def embed_documents(self, texts):
+        return self._embed(embedding_model(self), texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text):
+        # Kept apart from document vectors, some models embed queries differently
+        namespace = embedding_model(self) + ":query"
+        return self._embed(namespace, [text], lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+
+def print_embedding_cache_summary():
+    with _lock:
+        stats = dict(_stats)
+    print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} texts embedded")
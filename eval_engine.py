@@ -0,0 +1,275 @@
+import asyncio
+import copy
+import math
+import os
+import random
+from statistics import NormalDist
+
+from deepeval.metrics import LatencyMetric, CostMetric
+
+from checkpoint import RESUME, load_checkpoint, clear_checkpoint, save_pair, restore_finished, script_namespace
+from fused_judge import is_fusable, a_fused_measure
+from profiling import span
+
+# Upper bound on judge calls in flight at once. Can be overridden per call or
+# through the DEEPEVAL_MAX_CONCURRENCY environment variable.
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("DEEPEVAL_MAX_CONCURRENCY", "10"))
+
+# With fail-fast on, a test case that fails a local gate is never sent to the judge
+FAIL_FAST = os.environ.get("DEEPEVAL_FAIL_FAST", "0") == "1"
+
+# With fused judging on, compatible metrics share one judge request per test case
+FUSED_JUDGE = os.environ.get("DEEPEVAL_FUSED_JUDGE", "0") == "1"
+
+# Smoke-run mode: DEEPEVAL_SEQUENTIAL=1 samples test cases in random order and stops
+# each metric once its pass rate is known to be above or below the target
+SEQUENTIAL = os.environ.get("DEEPEVAL_SEQUENTIAL", "0") == "1"
+TARGET_PASS_RATE = float(os.environ.get("DEEPEVAL_TARGET_PASS_RATE", "0.8"))
+CONFIDENCE = float(os.environ.get("DEEPEVAL_CONFIDENCE", "0.95"))
+# Test cases drawn per step; defaults to the concurrency limit so the judge stays busy
+SEQUENTIAL_BATCH_SIZE = int(os.environ.get("DEEPEVAL_SEQUENTIAL_BATCH", "0"))
+
+# Metrics that only compare numbers already on the test case, no judge call
+LOCAL_METRICS = (LatencyMetric, CostMetric)
+
+
+def is_local_metric(metric):
+    return isinstance(metric, LOCAL_METRICS)
+
+
+def order_cheap_first(metrics):
+    # sorted() is stable, so metrics keep their order within each cost class
+    return sorted(metrics, key=lambda metric: not is_local_metric(metric))
+
+
+def gate_metrics(test_case, metrics, fail_fast=None):
+    # For a single test case (e.g. inside a parametrized test): with fail-fast
+    # on, returns the metrics cheap-first, without the judged ones if a local
+    # gate failed. Otherwise the metrics are returned as given.
+    if not (FAIL_FAST if fail_fast is None else fail_fast):
+        return metrics
+    metrics = order_cheap_first(metrics)
+    local_metrics = [metric for metric in metrics if is_local_metric(metric)]
+    for metric in local_metrics:
+        metric.measure(test_case)
+    if all(metric.is_successful() for metric in local_metrics):
+        return metrics
+    return local_metrics
+
+
+async def _measure_one(metric, test_case, semaphore, finished, namespace):
+    # Pairs finished before an interrupted run are restored, not judged again
+    if not restore_finished(test_case, [metric], finished):
+        return metric, test_case
+    async with semaphore:
+        with span(f"measure:{metric.__class__.__name__}", test_case=test_case.id):
+            if hasattr(metric, "a_measure"):
+                await metric.a_measure(test_case)
+            else:
+                # Older deepeval metrics only expose the blocking measure()
+                await asyncio.to_thread(metric.measure, test_case)
+    save_pair(test_case, metric, namespace)
+    return metric, test_case
+
+
+async def _measure_all(metrics, test_cases, semaphore, finished, namespace):
+    # Metrics keep score/reason on the instance, so every (metric, test case)
+    # pair gets its own shallow copy. The judge model object stays shared.
+    tasks = [
+        _measure_one(copy.copy(metric), test_case, semaphore, finished, namespace)
+        for metric in metrics
+        for test_case in test_cases
+    ]
+    return list(await asyncio.gather(*tasks))
+
+
+async def _fused_one(metrics, test_case, semaphore, finished, namespace):
+    pending = restore_finished(test_case, metrics, finished)
+    if pending:
+        async with semaphore:
+            with span("measure:fused", test_case=test_case.id):
+                await a_fused_measure(pending, test_case)
+        for metric in pending:
+            save_pair(test_case, metric, namespace)
+    return [(metric, test_case) for metric in metrics]
+
+
+async def _measure_fused(metrics, test_cases, semaphore, finished, namespace):
+    fused_metrics = [metric for metric in metrics if is_fusable(metric)]
+    other_metrics = [metric for metric in metrics if not is_fusable(metric)]
+    # The unfused metrics and the fused requests share the semaphore and run together
+    other, per_case = await asyncio.gather(
+        _measure_all(other_metrics, test_cases, semaphore, finished, namespace),
+        asyncio.gather(*[
+            _fused_one([copy.copy(metric) for metric in fused_metrics], test_case, semaphore, finished, namespace)
+            for test_case in test_cases
+        ]),
+    )
+    # Regroup by metric, in the order the metrics were given, like the unfused path
+    other_columns = iter([other[start:start + len(test_cases)] for start in range(0, len(other), len(test_cases))])
+    fused_columns = iter([[pairs[position] for pairs in per_case] for position in range(len(fused_metrics))])
+    results = []
+    for metric in metrics:
+        results += next(fused_columns if is_fusable(metric) else other_columns)
+    return results
+
+
+async def _measure_batch(metrics, test_cases, semaphore, finished, namespace, fail_fast, fused):
+    measure = _measure_fused if (FUSED_JUDGE if fused is None else fused) else _measure_all
+    if not (FAIL_FAST if fail_fast is None else fail_fast):
+        # Nothing to gate: every pair runs at once and results keep the metric order
+        return await measure(metrics, test_cases, semaphore, finished, namespace)
+
+    local_metrics = [metric for metric in metrics if is_local_metric(metric)]
+    judged_metrics = [metric for metric in metrics if not is_local_metric(metric)]
+
+    results = await _measure_all(local_metrics, test_cases, semaphore, finished, namespace)
+
+    failed = {id(test_case) for metric, test_case in results if not metric.is_successful()}
+    judged_cases = [test_case for test_case in test_cases if id(test_case) not in failed]
+    skipped = (len(test_cases) - len(judged_cases)) * len(judged_metrics)
+    if skipped:
+        print(f"Fail-fast: skipped {skipped} judge calls for {len(failed)} test cases that failed a local gate")
+
+    results += await measure(judged_metrics, judged_cases, semaphore, finished, namespace)
+    return results
+
+
+def _start_checkpoint(resume, namespace):
+    # Every finished pair is checkpointed; a fresh run starts from an empty checkpoint.
+    # Each caller has its own namespace, by default the running script's name.
+    namespace = namespace or script_namespace()
+    if RESUME if resume is None else resume:
+        return namespace, load_checkpoint(namespace)
+    clear_checkpoint(namespace)
+    return namespace, {}
+
+
+async def a_measure_metrics(metrics, test_cases, max_concurrency=None, fail_fast=None, fused=None, resume=None,
+                            sequential=None, namespace=None):
+    if SEQUENTIAL if sequential is None else sequential:
+        results, decisions = await a_measure_sequentially(
+            metrics, test_cases, max_concurrency=max_concurrency, fail_fast=fail_fast, fused=fused, resume=resume,
+            namespace=namespace
+        )
+        print_sequential_summary(decisions)
+        return results
+    semaphore = asyncio.Semaphore(max_concurrency or DEFAULT_MAX_CONCURRENCY)
+    namespace, finished = _start_checkpoint(resume, namespace)
+    return await _measure_batch(metrics, list(test_cases), semaphore, finished, namespace, fail_fast, fused)
+
+
+def pass_rate_bounds(passes, total, confidence, looks=1):
+    # Wilson score interval for the pass rate. The interval is checked after
+    # every batch, so the error rate is split across all looks (Bonferroni)
+    # to keep the overall confidence at the requested level.
+    if total == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(1 - (1 - confidence) / (2 * looks))
+    rate = passes / total
+    centre = (rate + z * z / (2 * total)) / (1 + z * z / total)
+    margin = z * math.sqrt(rate * (1 - rate) / total + z * z / (4 * total * total)) / (1 + z * z / total)
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def _label(metrics, position):
+    # Metrics of the same class (two GEvals, two thresholds) are told apart by position
+    name = metrics[position].__class__.__name__
+    if sum(metric.__class__.__name__ == name for metric in metrics) > 1:
+        return f"{name} #{position + 1}"
+    return name
+
+
+async def a_measure_sequentially(metrics, test_cases, target_pass_rate=None, confidence=None, batch_size=None,
+                                 seed=None, max_concurrency=None, fail_fast=None, fused=None, resume=None,
+                                 namespace=None):
+    # Draws test cases in random order, one batch at a time, and stops scoring a
+    # metric once the confidence interval on its pass rate is entirely above or
+    # below the target. Returns the measured pairs and one
+    # (label, decision, passes, total, low, high) per metric, in metric order.
+    #
+    # With fail-fast on, the local gate metrics keep running on every batch even
+    # once decided, so later batches stay gated. Judged metrics then only see
+    # test cases that passed the gates: their pass rate is conditional on them.
+    target_pass_rate = TARGET_PASS_RATE if target_pass_rate is None else target_pass_rate
+    confidence = CONFIDENCE if confidence is None else confidence
+    fail_fast = FAIL_FAST if fail_fast is None else fail_fast
+    batch_size = batch_size or SEQUENTIAL_BATCH_SIZE or max_concurrency or DEFAULT_MAX_CONCURRENCY
+    semaphore = asyncio.Semaphore(max_concurrency or DEFAULT_MAX_CONCURRENCY)
+    namespace, finished = _start_checkpoint(resume, namespace)
+
+    test_cases = list(getattr(test_cases, "test_cases", test_cases))
+    random.Random(seed).shuffle(test_cases)
+    looks = max(1, math.ceil(len(test_cases) / batch_size))
+
+    # The per-pair copies _measure_batch makes keep the tag, which maps each
+    # result back to the metric it was measured for
+    tagged = []
+    for position, metric in enumerate(metrics):
+        metric = copy.copy(metric)
+        metric._sequential_position = position
+        tagged.append(metric)
+    counts = [[0, 0] for _ in metrics]
+    undecided = set(range(len(metrics)))
+    decisions = {}
+    results = []
+    for start in range(0, len(test_cases), batch_size):
+        batch_metrics = [
+            metric for metric in tagged
+            if metric._sequential_position in undecided or (fail_fast and is_local_metric(metric))
+        ]
+        batch_results = await _measure_batch(
+            batch_metrics, test_cases[start:start + batch_size], semaphore, finished, namespace, fail_fast, fused
+        )
+        results += batch_results
+        for metric, _ in batch_results:
+            if metric._sequential_position in undecided:
+                counts[metric._sequential_position][0] += metric.is_successful()
+                counts[metric._sequential_position][1] += 1
+
+        for position in sorted(undecided):
+            passes, total = counts[position]
+            low, high = pass_rate_bounds(passes, total, confidence, looks)
+            if low >= target_pass_rate or high < target_pass_rate:
+                decisions[position] = ("pass" if low >= target_pass_rate else "fail", passes, total, low, high)
+                undecided.discard(position)
+        if not undecided:
+            break
+
+    # Metrics that never cleared the bound were scored on every case, so the
+    # observed pass rate is the dataset's pass rate
+    for position in undecided:
+        passes, total = counts[position]
+        rate = passes / total if total else 0.0
+        decisions[position] = ("pass" if rate >= target_pass_rate else "fail", passes, total, rate, rate)
+
+    # Grouped by metric like the other evaluation paths
+    results.sort(key=lambda pair: pair[0]._sequential_position)
+    return results, [(_label(metrics, position),) + decisions[position] for position in range(len(metrics))]
+
+
+def measure_sequentially(metrics, test_cases, target_pass_rate=None, confidence=None, batch_size=None, seed=None,
+                         max_concurrency=None, fail_fast=None, fused=None, resume=None, namespace=None):
+    return asyncio.run(a_measure_sequentially(
+        metrics, test_cases, target_pass_rate, confidence, batch_size, seed, max_concurrency, fail_fast, fused, resume,
+        namespace
+    ))
+
+
+def print_sequential_summary(decisions, target_pass_rate=None):
+    target_pass_rate = TARGET_PASS_RATE if target_pass_rate is None else target_pass_rate
+    for name, decision, passes, total, low, high in decisions:
+        print(
+            f"Sequential: {name} {decision.upper()} after {total} test cases "
+            f"({passes} passed, pass rate in [{low:.2f}, {high:.2f}], target {target_pass_rate:.2f})"
+        )
+
+
+def measure_metrics_concurrently(metrics, test_cases, max_concurrency=None, fail_fast=None, fused=None, resume=None,
+                                 sequential=None, namespace=None):
+    # Returns (measured metric, test case) pairs grouped by metric, in metric
+    # order (local metrics first with fail-fast on). Pairs skipped by fail-fast
+    # or sequential stopping are left out.
+    return asyncio.run(a_measure_metrics(
+        metrics, test_cases, max_concurrency, fail_fast, fused, resume, sequential, namespace
+    ))
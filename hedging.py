@@ -0,0 +1,200 @@
+import asyncio
+import collections
+import concurrent.futures
+import contextvars
+import functools
+import os
+import threading
+import time
+
+from deepeval.models import GPTModel
+
+# Off by default; DEEPEVAL_HEDGE=1 sends a duplicate of any call still running
+# after the DEEPEVAL_HEDGE_PERCENTILE latency of recent calls from the same source
+HEDGING = os.environ.get("DEEPEVAL_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = float(os.environ.get("DEEPEVAL_HEDGE_PERCENTILE", "95"))
+# Used until a source has HEDGE_MIN_SAMPLES latencies to take the percentile of
+HEDGE_INITIAL_DELAY = float(os.environ.get("DEEPEVAL_HEDGE_DELAY", "10"))
+HEDGE_MIN_SAMPLES = 20
+
+# Seconds a judge or chain call may take before it fails with TimeoutError; 0 means no deadline
+CALL_DEADLINE = float(os.environ.get("DEEPEVAL_CALL_DEADLINE", "0"))
+
+_latencies = collections.defaultdict(lambda: collections.deque(maxlen=500))
+_stats = collections.defaultdict(lambda: {"calls": 0, "hedged": 0, "hedge_wins": 0, "saved_seconds": 0.0, "timeouts": 0})
+_lock = threading.Lock()
+# Blocking calls run here so the caller can stop waiting on them
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=64, thread_name_prefix="hedged-call")
+
+
+def _submit(fn, *args, **kwargs):
+    # Context variables (e.g. which metric a judge call is for) follow the call into the pool
+    return _executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def hedge_delay(source):
+    with _lock:
+        latencies = sorted(_latencies[source])
+    if len(latencies) < HEDGE_MIN_SAMPLES:
+        return HEDGE_INITIAL_DELAY
+    return latencies[min(len(latencies) - 1, int(len(latencies) * HEDGE_PERCENTILE / 100))]
+
+
+def _observe(source, submitted):
+    # Every completed attempt's own latency feeds the percentile, including
+    # hedges that lost. A cancelled attempt only ran for a lower bound of its
+    # latency, which would pull the hedge delay down, so it is left out.
+    def callback(future):
+        if future.cancelled():
+            return
+        with _lock:
+            _latencies[source].append(time.perf_counter() - submitted)
+    return callback
+
+
+def _count(source, key, amount=1):
+    with _lock:
+        _stats[source][key] += amount
+
+
+def _saved(source, won_at):
+    # A blocking primary is left to finish, so the tail latency the hedge saved can be measured
+    def callback(future):
+        _count(source, "saved_seconds", time.perf_counter() - won_at)
+    return callback
+
+
+def _estimated_saving(source, elapsed):
+    # A cancelled primary never reports its latency. It had already outlived
+    # the hedge delay, so it is assumed to take as long as the average of the
+    # recorded calls that outlived it too; without any, one more hedge delay.
+    with _lock:
+        slower = [latency for latency in _latencies[source] if latency > elapsed]
+    if not slower:
+        return hedge_delay(source)
+    return sum(slower) / len(slower) - elapsed
+
+
+def _remaining(started, until):
+    # Seconds to wait for the next event: the hedge delay, the deadline or whichever comes first
+    limits = [limit for limit in (until, started + CALL_DEADLINE if CALL_DEADLINE else None) if limit is not None]
+    return max(0.0, min(limits) - time.perf_counter()) if limits else None
+
+
+def _winner(source, attempts, done):
+    # The first attempt that succeeded
+    for attempt in attempts:
+        if attempt in done and attempt.exception() is None:
+            if attempt is not attempts[0]:
+                _count(source, "hedge_wins")
+            return attempt
+    return None
+
+
+def _timeout(source):
+    _count(source, "timeouts")
+    return TimeoutError(f"{source} call exceeded its {CALL_DEADLINE}s deadline")
+
+
+def hedged_call(fn, *args, source="chain", **kwargs):
+    # Runs a blocking call such as covid_qa_chain.run with the deadline and hedging applied
+    if not (HEDGING or CALL_DEADLINE):
+        return fn(*args, **kwargs)
+    _count(source, "calls")
+    started = time.perf_counter()
+    attempts = [_submit(fn, *args, **kwargs)]
+    attempts[0].add_done_callback(_observe(source, started))
+
+    if HEDGING:
+        concurrent.futures.wait(attempts, timeout=_remaining(started, started + hedge_delay(source)))
+        if not attempts[0].done() and _remaining(started, None) != 0:
+            _count(source, "hedged")
+            attempts.append(_submit(fn, *args, **kwargs))
+            attempts[1].add_done_callback(_observe(source, time.perf_counter()))
+
+    pending = set(attempts)
+    while pending:
+        done, pending = concurrent.futures.wait(
+            pending, timeout=_remaining(started, None), return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        if not done:
+            # Threads cannot be cancelled; the abandoned attempts finish in the background
+            raise _timeout(source)
+        winner = _winner(source, attempts, done)
+        if winner is not None:
+            if winner is not attempts[0]:
+                attempts[0].add_done_callback(_saved(source, time.perf_counter()))
+            return winner.result()
+    # Every attempt failed, surface the primary's error
+    return attempts[0].result()
+
+
+async def a_hedged_call(fn, *args, source="judge", **kwargs):
+    # Coroutine counterpart of hedged_call for async functions such as GPTModel.a_generate
+    if not (HEDGING or CALL_DEADLINE):
+        return await fn(*args, **kwargs)
+    _count(source, "calls")
+    started = time.perf_counter()
+    attempts = [asyncio.ensure_future(fn(*args, **kwargs))]
+    attempts[0].add_done_callback(_observe(source, started))
+
+    if HEDGING:
+        await asyncio.wait(attempts, timeout=_remaining(started, started + hedge_delay(source)))
+        if not attempts[0].done() and _remaining(started, None) != 0:
+            _count(source, "hedged")
+            attempts.append(asyncio.ensure_future(fn(*args, **kwargs)))
+            attempts[1].add_done_callback(_observe(source, time.perf_counter()))
+
+    pending = set(attempts)
+    while pending:
+        done, pending = await asyncio.wait(
+            pending, timeout=_remaining(started, None), return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+            for attempt in pending:
+                attempt.cancel()
+            raise _timeout(source)
+        winner = _winner(source, attempts, done)
+        if winner is not None:
+            # Unlike threads, the losing request can be cancelled instead of paid for
+            for attempt in attempts:
+                if not attempt.done():
+                    attempt.cancel()
+            if winner is not attempts[0]:
+                _count(source, "saved_seconds", _estimated_saving(source, time.perf_counter() - started))
+            return winner.result()
+    return attempts[0].result()
+
+
+def install_hedging():
+    # Call after install_rate_limiter() so every attempt, hedges included,
+    # takes its own rate limiter ticket
+    if getattr(GPTModel, "_hedging_installed", False):
+        return
+    generate = GPTModel.generate
+
+    @functools.wraps(generate)
+    def hedged_generate(self, prompt, *args, **kwargs):
+        return hedged_call(generate, self, prompt, *args, source="judge", **kwargs)
+
+    GPTModel.generate = hedged_generate
+    if hasattr(GPTModel, "a_generate"):
+        a_generate = GPTModel.a_generate
+
+        @functools.wraps(a_generate)
+        async def hedged_a_generate(self, prompt, *args, **kwargs):
+            return await a_hedged_call(a_generate, self, prompt, *args, source="judge", **kwargs)
+
+        GPTModel.a_generate = hedged_a_generate
+    GPTModel._hedging_installed = True
+
+
+def print_hedging_summary():
+    with _lock:
+        stats = {source: dict(values) for source, values in _stats.items()}
+    for source, values in stats.items():
+        print(
+            f"Hedging ({source}): {values['hedged']} of {values['calls']} calls hedged, "
+            f"{values['hedge_wins']} won by the hedge, ~{values['saved_seconds']:.1f}s tail latency saved, "
+            f"{values['timeouts']} deadline timeouts"
+        )
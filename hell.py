@@ -2,6 +2,13 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from deepeval.metrics import HallucinationMetric, BiasMetric, LatencyMetric, CostMetric
 from deepeval.test_case import LLMTestCase
+from eval_engine import measure_metrics_concurrently
+from metric_directions import add_status
+from metric_cache import install_verdict_cache, print_cache_summary
+from rate_limiter import install_rate_limiter, print_rate_limit_summary
+
+install_verdict_cache()
+install_rate_limiter()
 
 def create_test_case():
     return LLMTestCase(
@@ -23,18 +30,16 @@ def measure_metrics(test_cases):
 
     metric_results = []
 
-    for metric in metrics:
-        for test_case in test_cases:
-            metric.measure(test_case)
-            metric_results.append([test_case.id, metric.__class__.__name__, metric.score, metric.reason])
+    for metric, test_case in measure_metrics_concurrently(metrics, test_cases):
+        metric_results.append([test_case.id, metric.__class__.__name__, metric.score, metric.reason, metric.threshold])
 
     return metric_results
 
 def create_pie_chart(metric_results):
-    df = pd.DataFrame(metric_results, columns=['Test Case', 'Metric', 'Score', 'Reason'])
+    df = pd.DataFrame(metric_results, columns=['Test Case', 'Metric', 'Score', 'Reason', 'Threshold'])
 
-    # Determine pass/fail status based on some condition (you can customize this)
-    df['Status'] = df['Score'] > 0.5  # Change the condition as needed
+    # Pass/fail follows each metric's direction (see metric_directions.py)
+    df = add_status(df)
 
     # Create a pie chart
     plt.figure(figsize=(8, 6))
@@ -46,7 +51,7 @@ def create_pie_chart(metric_results):
     plt.savefig('pie_chart.png')
 
 def log_report_table(metrics_results):
-    table_columns = ['Test Case', 'Metric', 'Score', 'Reason']
+    table_columns = ['Test Case', 'Metric', 'Score', 'Reason', 'Threshold']
     report_df = pd.DataFrame(metrics_results, columns=table_columns)
 
     # Save the HTML report to a file
@@ -205,6 +210,8 @@ def main():
     metric_results = measure_metrics([test_case])
     create_pie_chart(metric_results)
     log_report_table(metric_results)
+    print_cache_summary()
+    print_rate_limit_summary()
 
 if __name__ == "__main__":
     main()
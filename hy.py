@@ -3,6 +3,13 @@ import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from deepeval.metrics import HallucinationMetric, BiasMetric, LatencyMetric, CostMetric
 from deepeval.test_case import LLMTestCase
+from eval_engine import measure_metrics_concurrently
+from metric_directions import add_status
+from metric_cache import install_verdict_cache, print_cache_summary
+from rate_limiter import install_rate_limiter, print_rate_limit_summary
+
+install_verdict_cache()
+install_rate_limiter()
 
 def create_test_case():
     return LLMTestCase(
@@ -24,17 +31,20 @@ def measure_metrics(test_cases):
 
     metric_results = []
 
-    for metric in metrics:
-        for test_case in test_cases:
-            metric.measure(test_case)
-            metric_results.append([test_case.id, metric.__class__.__name__, metric.score, metric.reason])
+    for metric, test_case in measure_metrics_concurrently(metrics, test_cases):
+        metric_results.append([test_case.id, metric.__class__.__name__, metric.score, metric.reason, metric.threshold])
 
     return metric_results
 
+def count_pass_fail(metric_results):
+    # Pass/fail follows each metric's direction (see metric_directions.py)
+    df = add_status(pd.DataFrame(metric_results, columns=['Test Case', 'Metric', 'Score', 'Reason', 'Threshold']))
+    pass_count = int((df['Status'] == 'Pass').sum())
+    return pass_count, len(df) - pass_count
+
 def create_pie_chart(metric_results):
     # Count the number of passing and failing test cases
-    pass_count = sum(1 for result in metric_results if result[2] >= 0.7)
-    fail_count = sum(1 for result in metric_results if result[2] < 0.7)
+    pass_count, fail_count = count_pass_fail(metric_results)
 
     # Create a pie chart with passing and failing percentages
     labels = ['Pass', 'Fail']
@@ -51,8 +61,7 @@ def create_pie_chart(metric_results):
 
 def animate_pie_chart(metric_results):
     # Count the number of passing and failing test cases
-    pass_count = sum(1 for result in metric_results if result[2] >= 0.7)
-    fail_count = sum(1 for result in metric_results if result[2] < 0.7)
+    pass_count, fail_count = count_pass_fail(metric_results)
 
     # Create a pie chart with passing and failing percentages
     labels = ['Pass', 'Fail']
@@ -73,7 +82,7 @@ def animate_pie_chart(metric_results):
     return ani.to_jshtml()
 
 def log_report_table(metrics_results, animated_pie_chart):
-    table_columns = ['Test Case', 'Metric', 'Score', 'Reason']
+    table_columns = ['Test Case', 'Metric', 'Score', 'Reason', 'Threshold']
     report_df = pd.DataFrame(metrics_results, columns=table_columns)
 
     # Save the HTML report to a file
@@ -228,6 +237,8 @@ def main():
     create_pie_chart(metric_results)
     animated_pie_chart = animate_pie_chart(metric_results)
     log_report_table(metric_results, animated_pie_chart)
+    print_cache_summary()
+    print_rate_limit_summary()
 
 if __name__ == "__main__":
     main()
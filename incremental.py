@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+
+from metric_cache import test_case_fields, judge_model
+
+MANIFEST_PATH = os.environ.get("DEEPEVAL_MANIFEST", ".eval_manifest.json")
+
+# Off by default; DEEPEVAL_INCREMENTAL=1 re-evaluates only new or changed entries
+INCREMENTAL = os.environ.get("DEEPEVAL_INCREMENTAL", "0") == "1"
+
+
+def _sha256(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def entry_key(test_case):
+    return test_case.id or _sha256(test_case.input)
+
+
+def _row_key(row):
+    return row['Test Case'] or _sha256(row['Input'])
+
+
+def metric_config(metric):
+    return {
+        "metric": metric.__class__.__name__,
+        "threshold": metric.threshold,
+        "model": judge_model(metric),
+        "include_reason": getattr(metric, "include_reason", None),
+    }
+
+
+def entry_hash(test_case, metrics):
+    # Changing the entry or any metric's configuration invalidates its stored results
+    return _sha256({
+        "id": test_case.id,
+        "fields": test_case_fields(test_case),
+        "metrics": [metric_config(metric) for metric in metrics],
+    })
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH) as file:
+        return json.load(file)
+
+
+def split_changed(test_cases, metrics, manifest):
+    # Returns the test cases that need evaluating and the stored
+    # (metric position, row) entries of everything unchanged
+    changed = []
+    reused = []
+    for test_case in test_cases:
+        stored = manifest.get(entry_key(test_case))
+        if stored and stored["hash"] == entry_hash(test_case, metrics):
+            reused += [(position, row) for position, row in stored["rows"]]
+        else:
+            changed.append(test_case)
+    return changed, reused
+
+
+def update_manifest(manifest, test_cases, metrics, entries):
+    rows_by_entry = {}
+    for position, row in entries:
+        rows_by_entry.setdefault(_row_key(row), []).append((position, row))
+
+    updated = {}
+    for test_case in test_cases:
+        key = entry_key(test_case)
+        current_hash = entry_hash(test_case, metrics)
+        if key in rows_by_entry:
+            # A judge error stops assert_test early and leaves metrics without a
+            # row; such an entry is left out so the next run evaluates it again
+            if {position for position, _ in rows_by_entry[key]} >= set(range(len(metrics))):
+                updated[key] = {"hash": current_hash, "rows": rows_by_entry[key]}
+        elif key in manifest and manifest[key]["hash"] == current_hash:
+            updated[key] = manifest[key]
+    # Entries no longer in the dataset simply drop out of the manifest
+    with open(MANIFEST_PATH, "w") as file:
+        json.dump(updated, file, default=str)
+    return updated
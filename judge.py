@@ -0,0 +1,29 @@
+import json
+
+from deepeval.models import GPTModel
+
+
+def judge_client(metric):
+    # The metric's own judge model, or a GPTModel for the model name it was given
+    model = getattr(metric, "model", None)
+    if hasattr(model, "generate"):
+        return model
+    return GPTModel(model=getattr(metric, "evaluation_model", None))
+
+
+def _text(output):
+    # Newer deepeval models return (text, cost)
+    return output[0] if isinstance(output, tuple) else output
+
+
+def generate(metric, prompt):
+    return _text(judge_client(metric).generate(prompt))
+
+
+async def a_generate(metric, prompt):
+    return _text(await judge_client(metric).a_generate(prompt))
+
+
+def load_json(text):
+    # Judges sometimes wrap the JSON in prose or code fences
+    return json.loads(text[text.find("{"):text.rfind("}") + 1])
@@ -0,0 +1,201 @@
+import contextlib
+import contextvars
+import functools
+import hashlib
+import html
+import json
+import threading
+import time
+
+from deepeval.models import GPTModel
+
+from metric_cache import CACHED_METRICS, test_case_fields
+
+# (metric name, test case) the judge call being made belongs to
+_judging = contextvars.ContextVar("judging", default=("unattributed", "unattributed"))
+
+_totals = {}
+_lock = threading.Lock()
+
+FIELDS = ("calls", "prompt_tokens", "completion_tokens", "seconds", "retries", "cost")
+
+
+def _tokens(text):
+    # ~4 characters per token, the same estimate the rate limiter budgets with
+    return len(text or "") // 4
+
+
+def _retries(generate):
+    # Best effort: deepeval retries inside a tenacity-decorated generate, whose
+    # wrapper keeps the statistics of its last call. Our own patches copy the
+    # `retry` attribute, so the tenacity wrapper is the innermost function carrying it.
+    tenacity_wrapper = None
+    while generate is not None:
+        if hasattr(generate, "retry"):
+            tenacity_wrapper = generate
+        generate = getattr(generate, "__wrapped__", None)
+    statistics = getattr(tenacity_wrapper, "statistics", None) or {}
+    return max(0, statistics.get("attempt_number", 1) - 1)
+
+
+def _test_case_label(test_case):
+    # A ConversationalTestCase has neither id nor input, only its messages
+    label = getattr(test_case, "id", None) or getattr(test_case, "input", None)
+    if label:
+        return label
+    fields = json.dumps(test_case_fields(test_case), sort_keys=True, default=str)
+    return f"conversation {hashlib.sha256(fields.encode('utf-8')).hexdigest()[:12]}"
+
+
+@contextlib.contextmanager
+def judging(metric_name, test_case):
+    token = _judging.set((metric_name, _test_case_label(test_case)))
+    try:
+        yield
+    finally:
+        _judging.reset(token)
+
+
+def record_call(prompt, output, seconds, retries):
+    # Newer deepeval models return (text, cost in USD)
+    text, cost = output if isinstance(output, tuple) else (output, 0.0)
+    key = _judging.get()
+    with _lock:
+        totals = _totals.setdefault(key, dict.fromkeys(FIELDS, 0))
+        totals["calls"] += 1
+        totals["prompt_tokens"] += _tokens(prompt)
+        totals["completion_tokens"] += _tokens(text if isinstance(text, str) else str(text))
+        totals["seconds"] += seconds
+        totals["retries"] += retries
+        totals["cost"] += cost or 0.0
+
+
+def _attributed_measure(measure):
+    @functools.wraps(measure)
+    def wrapper(self, test_case, *args, **kwargs):
+        with judging(self.__class__.__name__, test_case):
+            return measure(self, test_case, *args, **kwargs)
+    return wrapper
+
+
+def _attributed_a_measure(a_measure):
+    @functools.wraps(a_measure)
+    async def wrapper(self, test_case, *args, **kwargs):
+        with judging(self.__class__.__name__, test_case):
+            return await a_measure(self, test_case, *args, **kwargs)
+    return wrapper
+
+
+def install_judge_cost_tracking():
+    # Call before install_rate_limiter()/install_hedging() so only the judge
+    # request itself is timed, not the time spent queued for a ticket
+    if getattr(GPTModel, "_judge_costs_installed", False):
+        return
+    generate = GPTModel.generate
+
+    @functools.wraps(generate)
+    def tracked_generate(self, prompt, *args, **kwargs):
+        started = time.perf_counter()
+        output = generate(self, prompt, *args, **kwargs)
+        record_call(prompt, output, time.perf_counter() - started, _retries(generate))
+        return output
+
+    GPTModel.generate = tracked_generate
+    if hasattr(GPTModel, "a_generate"):
+        a_generate = GPTModel.a_generate
+
+        @functools.wraps(a_generate)
+        async def tracked_a_generate(self, prompt, *args, **kwargs):
+            started = time.perf_counter()
+            output = await a_generate(self, prompt, *args, **kwargs)
+            record_call(prompt, output, time.perf_counter() - started, _retries(a_generate))
+            return output
+
+        GPTModel.a_generate = tracked_a_generate
+    GPTModel._judge_costs_installed = True
+
+    for metric_class in CACHED_METRICS:
+        metric_class.measure = _attributed_measure(metric_class.measure)
+        if hasattr(metric_class, "a_measure"):
+            metric_class.a_measure = _attributed_a_measure(metric_class.a_measure)
+
+
+def cost_totals():
+    # [(metric name, test case), totals] pairs, e.g. to ship from an xdist worker
+    with _lock:
+        return [[list(key), dict(totals)] for key, totals in _totals.items()]
+
+
+def merge_cost_totals(entries):
+    with _lock:
+        for key, totals in entries:
+            merged = _totals.setdefault(tuple(key), dict.fromkeys(FIELDS, 0))
+            for field in FIELDS:
+                merged[field] += totals.get(field, 0)
+
+
+def _aggregate(position):
+    # position 0 groups by metric, 1 by test case
+    grouped = {}
+    with _lock:
+        for key, totals in _totals.items():
+            group = grouped.setdefault(key[position], dict.fromkeys(FIELDS, 0))
+            for field in FIELDS:
+                group[field] += totals[field]
+    return grouped
+
+
+def costs_per_metric():
+    return _aggregate(0)
+
+
+def costs_per_test_case():
+    return _aggregate(1)
+
+
+def _table(title, first_column, grouped):
+    rows = "".join(
+        f"<tr><td>{html.escape(str(name))}</td><td>{totals['calls']}</td>"
+        f"<td>{totals['prompt_tokens']}</td><td>{totals['completion_tokens']}</td>"
+        f"<td>{totals['seconds']:.2f}</td><td>{totals['retries']}</td><td>{totals['cost']:.4f}</td></tr>"
+        for name, totals in sorted(grouped.items(), key=lambda item: str(item[0]))
+    )
+    return f"""
+                <h3 class="mt-4">{title}</h3>
+                <table class="table table-striped">
+                    <thead>
+                        <tr>
+                            <th>{first_column}</th>
+                            <th>Judge Calls</th>
+                            <th>Prompt Tokens</th>
+                            <th>Completion Tokens</th>
+                            <th>Wall Time (s)</th>
+                            <th>Retries</th>
+                            <th>Cost (USD)</th>
+                        </tr>
+                    </thead>
+                    <tbody>{rows}</tbody>
+                </table>
+    """
+
+
+def judge_cost_html():
+    # Summary section for the HTML reports: what the evaluation itself cost
+    return f"""
+            <section id='judge-cost-summary' style="color: black;">
+                <h2 class="mt-4">Evaluation Cost</h2>
+                <p>Token counts are estimated at ~4 characters per token; cost is only known for judges that report it.</p>
+                {_table("Judge Cost by Metric", "Metric", costs_per_metric())}
+                {_table("Judge Cost by Test Case", "Test Case", costs_per_test_case())}
+            </section>
+    """
+
+
+def print_judge_cost_summary():
+    # Console form of judge_cost_html() for scripts without an HTML report
+    for metric, totals in sorted(costs_per_metric().items(), key=lambda item: str(item[0])):
+        print(
+            f"Judge cost ({metric}): {totals['calls']} calls, "
+            f"~{totals['prompt_tokens'] + totals['completion_tokens']} tokens, {totals['seconds']:.1f}s, "
+            f"{totals['retries']} retries, ${totals['cost']:.4f}"
+        )
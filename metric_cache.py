@@ -0,0 +1,250 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+from deepeval.metrics import (
+    HallucinationMetric,
+    BiasMetric,
+    AnswerRelevancyMetric,
+    GEval,
+    KnowledgeRetentionMetric,
+)
+
+CACHE_PATH = os.environ.get("DEEPEVAL_VERDICT_CACHE", ".verdict_cache.sqlite")
+
+# Only LLM-judged metrics are worth caching, Latency/Cost are plain comparisons
+CACHED_METRICS = (
+    HallucinationMetric,
+    BiasMetric,
+    AnswerRelevancyMetric,
+    GEval,
+    KnowledgeRetentionMetric,
+)
+
+# Test case fields each judge prompt is built from. Test cases that agree on
+# these (e.g. the same refusal answer to different inputs for BiasMetric) get
+# the same verdict, so they share one cache entry and one judge call.
+JUDGED_FIELDS = {
+    HallucinationMetric: ("actual_output", "context"),
+    BiasMetric: ("actual_output",),
+    AnswerRelevancyMetric: ("input", "actual_output"),
+}
+
+_stats = {"hits": 0, "misses": 0, "deduplicated": 0, "saved_tokens": 0}
+# cache key -> Future of (score, reason, success) for judge calls still running
+_in_flight = {}
+_lock = threading.Lock()
+# Set while a cached measure call runs, so the a_measure that deepeval's
+# measure() drives in async_mode is not mistaken for a second request
+_measuring = contextvars.ContextVar("verdict_cache_measuring", default=False)
+_connection = None
+
+
+def test_case_fields(test_case):
+    # ConversationalTestCase carries its turns as a list of LLMTestCase
+    if hasattr(test_case, "messages"):
+        return [test_case_fields(message) for message in test_case.messages]
+    return {
+        "input": test_case.input,
+        "actual_output": test_case.actual_output,
+        "expected_output": getattr(test_case, "expected_output", None),
+        "context": getattr(test_case, "context", None),
+        "retrieval_context": getattr(test_case, "retrieval_context", None),
+    }
+
+
+def judge_model(metric):
+    model = getattr(metric, "evaluation_model", None) or getattr(metric, "model", None)
+    if hasattr(model, "get_model_name"):
+        return model.get_model_name()
+    return str(model)
+
+
+def judged_fields(metric, test_case):
+    fields = test_case_fields(test_case)
+    for metric_class, names in JUDGED_FIELDS.items():
+        if isinstance(metric, metric_class) and isinstance(fields, dict):
+            return {name: fields[name] for name in names}
+    return fields
+
+
+def cache_key(metric, test_case, fused=False):
+    payload = {
+        "metric": metric.__class__.__name__,
+        "model": judge_model(metric),
+        "threshold": metric.threshold,
+        "include_reason": getattr(metric, "include_reason", None),
+        # GEval instances with different criteria must never share a verdict
+        "name": getattr(metric, "name", None),
+        "criteria": getattr(metric, "criteria", None),
+        "evaluation_steps": getattr(metric, "evaluation_steps", None),
+        "evaluation_params": getattr(metric, "evaluation_params", None),
+        "test_case": hashlib.sha256(
+            json.dumps(judged_fields(metric, test_case), sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest(),
+    }
+    if fused:
+        # Fused-prompt scores approximate the metric's own judging and never
+        # stand in for it, nor it for them
+        payload["fused"] = True
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def estimate_tokens(test_case):
+    # Rough prompt size of one judge call, ~4 characters per token
+    return len(json.dumps(test_case_fields(test_case), default=str)) // 4
+
+
+def _db():
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, score REAL, reason TEXT, success INTEGER, tokens INTEGER)"
+        )
+    return _connection
+
+
+def lookup(key):
+    with _lock:
+        return _db().execute(
+            "SELECT score, reason, success, tokens FROM verdicts WHERE key = ?", (key,)
+        ).fetchone()
+
+
+def store(key, metric, tokens):
+    with _lock:
+        _db().execute(
+            "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)",
+            (key, metric.score, metric.reason, int(bool(getattr(metric, "success", False))), tokens),
+        )
+        _db().commit()
+
+
+def serve_from_cache(metric, test_case, fused=False):
+    key = cache_key(metric, test_case, fused)
+    row = lookup(key)
+    if row is None:
+        with _lock:
+            _stats["misses"] += 1
+        return key, False
+    metric.score, metric.reason, success, tokens = row
+    metric.success = bool(success)
+    with _lock:
+        _stats["hits"] += 1
+        _stats["saved_tokens"] += tokens
+    return key, True
+
+
+def join_in_flight(key, test_case):
+    # Returns (future, True) when the caller has to make the judge call itself,
+    # or (future, False) to wait for the identical call already running
+    with _lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            _stats["deduplicated"] += 1
+            _stats["saved_tokens"] += estimate_tokens(test_case)
+            return future, False
+        future = _in_flight[key] = concurrent.futures.Future()
+        return future, True
+
+
+def finish_in_flight(key, future, metric, error=None):
+    with _lock:
+        _in_flight.pop(key, None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result((metric.score, metric.reason, getattr(metric, "success", None)))
+
+
+def _adopt(metric, result):
+    metric.score, metric.reason, metric.success = result
+
+
+def _cached_measure(measure):
+    @functools.wraps(measure)
+    def wrapper(self, test_case, *args, **kwargs):
+        if _measuring.get():
+            # The outer call already looked this verdict up, leads its request
+            # and stores it; joining it here would wait on itself
+            return measure(self, test_case, *args, **kwargs)
+        key, hit = serve_from_cache(self, test_case)
+        if hit:
+            return self.score
+        future, leader = join_in_flight(key, test_case)
+        if not leader:
+            _adopt(self, future.result())
+            return self.score
+        token = _measuring.set(True)
+        try:
+            score = measure(self, test_case, *args, **kwargs)
+        except BaseException as error:
+            finish_in_flight(key, future, self, error)
+            raise
+        finally:
+            _measuring.reset(token)
+        store(key, self, estimate_tokens(test_case))
+        finish_in_flight(key, future, self)
+        return score
+    return wrapper
+
+
+def _cached_a_measure(a_measure):
+    @functools.wraps(a_measure)
+    async def wrapper(self, test_case, *args, **kwargs):
+        if _measuring.get():
+            return await a_measure(self, test_case, *args, **kwargs)
+        key, hit = serve_from_cache(self, test_case)
+        if hit:
+            return self.score
+        # Concurrent duplicates wait on the first request instead of sending their own
+        future, leader = join_in_flight(key, test_case)
+        if not leader:
+            _adopt(self, await asyncio.wrap_future(future))
+            return self.score
+        token = _measuring.set(True)
+        try:
+            score = await a_measure(self, test_case, *args, **kwargs)
+        except BaseException as error:
+            finish_in_flight(key, future, self, error)
+            raise
+        finally:
+            _measuring.reset(token)
+        store(key, self, estimate_tokens(test_case))
+        finish_in_flight(key, future, self)
+        return score
+    return wrapper
+
+
+def install_verdict_cache():
+    # Patches the judged metric classes so assert_test, metric.measure and the
+    # concurrent engine all go through the cache
+    for metric_class in CACHED_METRICS:
+        if getattr(metric_class, "_verdict_cache_installed", False):
+            continue
+        metric_class.measure = _cached_measure(metric_class.measure)
+        if hasattr(metric_class, "a_measure"):
+            metric_class.a_measure = _cached_a_measure(metric_class.a_measure)
+        metric_class._verdict_cache_installed = True
+
+
+def cache_stats():
+    with _lock:
+        return dict(_stats)
+
+
+def print_cache_summary():
+    stats = cache_stats()
+    print(
+        f"Verdict cache: {stats['hits']} hits, {stats['misses']} misses "
+        f"({stats['deduplicated']} deduplicated against an identical request in flight), "
+        f"~{stats['saved_tokens']} judge tokens saved"
+    )
@@ -0,0 +1,78 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+HIGHER_IS_BETTER = "higher_is_better"
+LOWER_IS_BETTER = "lower_is_better"
+
+# Same rule deepeval uses for success: higher-is-better metrics pass at
+# score >= threshold, lower-is-better ones at score <= threshold.
+# Latency/Cost thresholds are the max_latency/max_cost they were built with.
+METRIC_DIRECTIONS = {
+    "HallucinationMetric": LOWER_IS_BETTER,
+    "BiasMetric": LOWER_IS_BETTER,
+    "ToxicityMetric": LOWER_IS_BETTER,
+    "LatencyMetric": LOWER_IS_BETTER,
+    "CostMetric": LOWER_IS_BETTER,
+    "AnswerRelevancyMetric": HIGHER_IS_BETTER,
+    "FaithfulnessMetric": HIGHER_IS_BETTER,
+    "ContextualPrecisionMetric": HIGHER_IS_BETTER,
+    "ContextualRecallMetric": HIGHER_IS_BETTER,
+    "ContextualRelevancyMetric": HIGHER_IS_BETTER,
+    "SummarizationMetric": HIGHER_IS_BETTER,
+    "KnowledgeRetentionMetric": HIGHER_IS_BETTER,
+    "GEval": HIGHER_IS_BETTER,
+}
+
+
+def register_metric_direction(metric_name, direction):
+    if direction not in (HIGHER_IS_BETTER, LOWER_IS_BETTER):
+        raise ValueError(f"Unknown metric direction: {direction}")
+    METRIC_DIRECTIONS[metric_name] = direction
+
+
+def metric_direction(metric_name):
+    # Custom metrics default to higher-is-better, like most deepeval metrics
+    return METRIC_DIRECTIONS.get(metric_name, HIGHER_IS_BETTER)
+
+
+def pass_mask(metric_names, scores, thresholds):
+    # One vectorized comparison for a whole results table; missing scores fail
+    metric_names = np.asarray(metric_names)
+    scores = np.asarray(scores, dtype=float)
+    thresholds = np.asarray(thresholds, dtype=float)
+    lower_is_better = np.isin(
+        metric_names,
+        [name for name, direction in METRIC_DIRECTIONS.items() if direction == LOWER_IS_BETTER],
+    )
+    return np.where(lower_is_better, scores <= thresholds, scores >= thresholds)
+
+
+def metric_passes(metric):
+    return bool(pass_mask([metric.__class__.__name__], [metric.score], [metric.threshold])[0])
+
+
+def add_status(metric_results):
+    # Accepts result rows (list of dicts) or a DataFrame with Metric, Score and
+    # Threshold columns, and returns the same kind with a Pass/Fail Status column
+    report_df = pd.DataFrame(metric_results)
+    if report_df.empty:
+        return metric_results
+    report_df['Status'] = np.where(
+        pass_mask(report_df['Metric'], report_df['Score'], report_df['Threshold']), 'Pass', 'Fail'
+    )
+    if isinstance(metric_results, pd.DataFrame):
+        return report_df
+    return report_df.to_dict('records')
+
+
+def stream_status(rows, chunk_size=1000):
+    # add_status over a stream of rows, one vectorized chunk at a time, so only
+    # chunk_size rows are ever held in memory
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from add_status(chunk)
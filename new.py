@@ -1,8 +1,15 @@
 from deepeval.metrics import HallucinationMetric, BiasMetric, LatencyMetric, CostMetric
 from deepeval.test_case import LLMTestCase
+from eval_engine import measure_metrics_concurrently
+from metric_directions import add_status
 import wandb
 import wandb.apis.reports as wr
 import pandas as pd
+from metric_cache import install_verdict_cache, print_cache_summary
+from rate_limiter import install_rate_limiter, print_rate_limit_summary
+
+install_verdict_cache()
+install_rate_limiter()
 
 def initialize_wandb():
     wandb.init(project="LLMtest")
@@ -34,16 +41,14 @@ def measure_metrics(test_cases):
 
     metric_results = []
 
-    for metric in metrics:
-        for test_case in test_cases:
-            metric.measure(test_case)
-            metric_results.append([test_case.id, metric.__class__.__name__, metric.score, metric.reason])
+    for metric, test_case in measure_metrics_concurrently(metrics, test_cases):
+        metric_results.append([test_case.id, metric.__class__.__name__, metric.score, metric.reason, metric.threshold])
 
     return metric_results
 
 def log_report_table(metrics_results):
-    table_columns = ['Test Case', 'Metric', 'Score', 'Reason']
-    report_df = pd.DataFrame(metrics_results, columns=table_columns)
+    table_columns = ['Test Case', 'Metric', 'Score', 'Reason', 'Threshold']
+    report_df = add_status(pd.DataFrame(metrics_results, columns=table_columns))
     styled_report = (
         report_df.style
         .set_table_styles([
@@ -79,6 +84,8 @@ def main():
     metric_results = measure_metrics([test_case])
 
     log_report_table(metric_results)
+    print_cache_summary()
+    print_rate_limit_summary()
     finish_wandb_run()
 
 if __name__ == "__main__":
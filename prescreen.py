@@ -0,0 +1,116 @@
+import asyncio
+import functools
+import os
+import re
+import threading
+
+import numpy as np
+from deepeval.metrics import HallucinationMetric
+
+from metric_directions import metric_passes
+
+# Off by default; DEEPEVAL_PRESCREEN=1 decides clear-cut outputs without the judge
+PRESCREEN = os.environ.get("DEEPEVAL_PRESCREEN", "0") == "1"
+
+# Every output sentence at least this close to some context sentence -> supported.
+# Nothing is decided as hallucinated locally: the judge only counts contradictions,
+# so an off-topic answer or a refusal far from every context still scores 0 there.
+SUPPORTED_SIMILARITY = float(os.environ.get("DEEPEVAL_PRESCREEN_SUPPORTED", "0.92"))
+
+# A close paraphrase that negates its context sentence embeds almost identically
+NEGATION = re.compile(r"\b(?:no|not|never|none|nor|neither|cannot|without)\b|n't", re.IGNORECASE)
+
+_vectors = {}
+_embeddings = None
+_stats = {"supported": 0, "escalated": 0}
+_lock = threading.Lock()
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in re.split(r"(?<=[.!?])\s+", text or "") if sentence.strip()]
+
+
+def embed(sentences):
+    # Unseen sentences are embedded in one batched request; shared context
+    # sentences are only ever embedded once per run
+    missing = [sentence for sentence in dict.fromkeys(sentences) if sentence not in _vectors]
+    if missing:
+        vectors = np.asarray(_embeddings.embed_documents(missing), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        # An empty text can embed to the zero vector; it stays zero, similar to nothing
+        vectors /= np.where(norms == 0, 1, norms)
+        with _lock:
+            _vectors.update(zip(missing, vectors))
+    return np.stack([_vectors[sentence] for sentence in sentences])
+
+
+def prime(test_cases):
+    # Embeds every output and context sentence of the dataset in one request
+    sentences = []
+    for test_case in test_cases:
+        sentences += split_sentences(test_case.actual_output)
+        sentences += list(test_case.context or [])
+    if sentences:
+        embed(sentences)
+
+
+def prescreen(test_case):
+    # Returns "supported", or None when the judge has to decide
+    output_sentences = split_sentences(test_case.actual_output)
+    contexts = list(test_case.context or [])
+    if not output_sentences or not contexts:
+        return None
+    # Rows are unit vectors, so one matrix product gives every cosine similarity
+    similarity = embed(output_sentences) @ embed(contexts).T
+    if similarity.max(axis=1).min() < SUPPORTED_SIMILARITY:
+        return None
+    for sentence, best in zip(output_sentences, similarity.argmax(axis=1)):
+        if bool(NEGATION.search(sentence)) != bool(NEGATION.search(contexts[best])):
+            return None
+    return "supported"
+
+
+def _decide(metric, test_case):
+    decision = prescreen(test_case)
+    with _lock:
+        _stats[decision or "escalated"] += 1
+    if decision != "supported":
+        return False
+    metric.score = 0
+    metric.reason = "The score is 0.00 because every sentence of the output closely matches the context (embedding pre-screen)."
+    metric.success = metric_passes(metric)
+    return True
+
+
+def install_hallucination_prescreen(embeddings):
+    # Wraps whatever HallucinationMetric.measure is installed at this point
+    # (deepeval's, the context verdict store or the verdict cache)
+    global _embeddings
+    _embeddings = embeddings
+    measure = HallucinationMetric.measure
+    a_measure = HallucinationMetric.a_measure
+
+    @functools.wraps(measure)
+    def prescreened_measure(self, test_case, *args, **kwargs):
+        if _decide(self, test_case):
+            return self.score
+        return measure(self, test_case, *args, **kwargs)
+
+    @functools.wraps(a_measure)
+    async def prescreened_a_measure(self, test_case, *args, **kwargs):
+        # Embedding unprimed sentences is a blocking request, keep it off the event loop
+        if await asyncio.to_thread(_decide, self, test_case):
+            return self.score
+        return await a_measure(self, test_case, *args, **kwargs)
+
+    HallucinationMetric.measure = prescreened_measure
+    HallucinationMetric.a_measure = prescreened_a_measure
+
+
+def print_prescreen_summary():
+    with _lock:
+        stats = dict(_stats)
+    print(
+        f"Hallucination pre-screen: {stats['supported']} supported, "
+        f"{stats['escalated']} escalated to the judge"
+    )
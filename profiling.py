@@ -0,0 +1,142 @@
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+
+# Off by default; DEEPEVAL_PROFILE=1 times every span. Disabled spans cost one
+# flag check, and @profiled leaves the function untouched.
+PROFILING = os.environ.get("DEEPEVAL_PROFILE", "0") == "1"
+
+# Folded stacks ("stage;sub-stage <microseconds>"), readable by flamegraph.pl and speedscope
+PROFILE_PATH = os.environ.get("DEEPEVAL_PROFILE_OUTPUT", "eval_profile.folded")
+
+# Names of the spans the current code runs inside, outermost first
+_stack = contextvars.ContextVar("profiling_stack", default=())
+
+# stack path -> [calls, wall seconds, cpu seconds]
+_spans = {}
+# (stage, test case) -> [calls, wall seconds, cpu seconds]
+_per_test_case = {}
+_lock = threading.Lock()
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, name, test_case):
+        self.name = name
+        self.test_case = test_case
+
+    def __enter__(self):
+        self._token = _stack.set(_stack.get() + (self.name,))
+        self._wall = time.perf_counter()
+        # CPU time of this thread; async spans also see other tasks run on the loop thread
+        self._cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        path = _stack.get()
+        _stack.reset(self._token)
+        with _lock:
+            _add(_spans, path, wall, cpu)
+            if self.test_case is not None:
+                _add(_per_test_case, (self.name, self.test_case), wall, cpu)
+        return False
+
+
+def _add(table, key, wall, cpu, calls=1):
+    totals = table.setdefault(key, [0, 0.0, 0.0])
+    totals[0] += calls
+    totals[1] += wall
+    totals[2] += cpu
+
+
+def span(name, test_case=None):
+    # with span("faiss_build"): ...  /  with span("measure", test_case=test_case.id): ...
+    if not PROFILING:
+        return _NULL_SPAN
+    return _Span(name, test_case)
+
+
+def profiled(name=None):
+    # Decorator form of span(); a no-op when profiling is off
+    def decorate(function):
+        if not PROFILING:
+            return function
+        stage = name or function.__name__
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with _Span(stage, None):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Span(stage, None):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def stage_breakdown():
+    # stage name -> [calls, wall seconds, cpu seconds], counting nested spans
+    # of the same name only once so recursion does not double count
+    breakdown = {}
+    with _lock:
+        for path, (calls, wall, cpu) in _spans.items():
+            if path[-1] not in path[:-1]:
+                _add(breakdown, path[-1], wall, cpu, calls)
+    return breakdown
+
+
+def test_case_breakdown():
+    with _lock:
+        return {key: list(totals) for key, totals in _per_test_case.items()}
+
+
+def export_profile(path=None):
+    # Self time (a span's wall time minus that of its children) per stack,
+    # which is what flame graph tools expect for folded input
+    with _lock:
+        spans = {path: totals[1] for path, totals in _spans.items()}
+    self_time = dict(spans)
+    for stack, wall in spans.items():
+        if len(stack) > 1 and stack[:-1] in self_time:
+            self_time[stack[:-1]] -= wall
+    with open(path or PROFILE_PATH, "w") as file:
+        for stack, seconds in sorted(self_time.items()):
+            file.write(f"{';'.join(stack)} {max(0, round(seconds * 1_000_000))}\n")
+
+
+def print_profile_summary():
+    if not PROFILING:
+        return
+    breakdown = stage_breakdown()
+    print(f"{'Stage':<30} {'Calls':>7} {'Wall (s)':>10} {'CPU (s)':>10} {'Mean wall (s)':>14}")
+    for stage, (calls, wall, cpu) in sorted(breakdown.items(), key=lambda item: -item[1][1]):
+        print(f"{stage:<30} {calls:>7} {wall:>10.3f} {cpu:>10.3f} {wall / calls:>14.3f}")
+
+    per_test_case = {}
+    for (stage, test_case), (calls, wall, cpu) in test_case_breakdown().items():
+        _add(per_test_case, test_case, wall, cpu, calls)
+    if per_test_case:
+        print(f"{'Slowest test cases':<30} {'Spans':>7} {'Wall (s)':>10} {'CPU (s)':>10}")
+        for test_case, (calls, wall, cpu) in sorted(per_test_case.items(), key=lambda item: -item[1][1])[:10]:
+            print(f"{str(test_case)[:30]:<30} {calls:>7} {wall:>10.3f} {cpu:>10.3f}")
+    export_profile()
+    print(f"Flame graph profile written to {PROFILE_PATH}")
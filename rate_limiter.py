@@ -0,0 +1,205 @@
+import asyncio
+import collections
+import functools
+import itertools
+import os
+import threading
+import time
+
+from deepeval.models import GPTModel
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Account-wide OpenAI budgets shared by every judge, chain and synthesizer call
+REQUESTS_PER_MINUTE = int(os.environ.get("OPENAI_RPM_LIMIT", "3500"))
+TOKENS_PER_MINUTE = int(os.environ.get("OPENAI_TPM_LIMIT", "90000"))
+
+# Completion tokens budgeted per request on top of the prompt estimate
+COMPLETION_TOKENS = 256
+
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting
+    return len(text) // 4 + COMPLETION_TOKENS
+
+
+class TokenBucketRateLimiter:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._request_bucket = float(requests_per_minute)
+        self._token_bucket = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        # Tickets are served strictly in arrival order so no caller starves.
+        # Queued callers sleep until the head hands off to them: threads on
+        # _turn, coroutines on their own asyncio.Event (ticket -> (loop, event)).
+        self._tickets = itertools.count()
+        self._serving = 0
+        self._abandoned = set()
+        self._turn = threading.Condition(self._lock)
+        self._waiters = {}
+        self._stats = {}
+        self._window = collections.deque()
+
+    def _refill(self, now):
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._request_bucket = min(self.requests_per_minute, self._request_bucket + elapsed * self.requests_per_minute / 60)
+        self._token_bucket = min(self.tokens_per_minute, self._token_bucket + elapsed * self.tokens_per_minute / 60)
+
+    def _advance(self):
+        # Called with the lock held once the head ticket is served or abandoned;
+        # skips callers that gave up while queued and wakes the next one
+        self._serving += 1
+        while self._serving in self._abandoned:
+            self._abandoned.discard(self._serving)
+            self._serving += 1
+        self._turn.notify_all()
+        if self._serving in self._waiters:
+            loop, event = self._waiters[self._serving]
+            loop.call_soon_threadsafe(event.set)
+
+    def _try_take(self, tokens):
+        # Only called by the head ticket. Returns 0 when the request may go
+        # out, otherwise seconds until the buckets hold enough budget
+        now = time.monotonic()
+        with self._lock:
+            self._refill(now)
+            # A single request bigger than the whole budget still gets through once the bucket is full
+            tokens = min(tokens, self.tokens_per_minute)
+            missing_requests = max(0.0, 1 - self._request_bucket)
+            missing_tokens = max(0.0, tokens - self._token_bucket)
+            if missing_requests or missing_tokens:
+                return max(missing_requests * 60 / self.requests_per_minute,
+                           missing_tokens * 60 / self.tokens_per_minute)
+            self._request_bucket -= 1
+            self._token_bucket -= tokens
+            # Only the last minute is reported, so older entries are dropped as we go
+            while self._window and now - self._window[0][0] >= 60:
+                self._window.popleft()
+            self._window.append((now, tokens))
+            self._advance()
+            return 0
+
+    def _abandon(self, ticket):
+        # The caller gave up (cancelled task, Ctrl-C) before its request went out
+        with self._lock:
+            if ticket == self._serving:
+                self._advance()
+            elif ticket > self._serving:
+                self._abandoned.add(ticket)
+
+    def _record(self, source, tokens, waited):
+        with self._lock:
+            stats = self._stats.setdefault(source, {"requests": 0, "tokens": 0, "wait_seconds": 0.0})
+            stats["requests"] += 1
+            stats["tokens"] += tokens
+            stats["wait_seconds"] += waited
+
+    def acquire(self, tokens, source="judge"):
+        ticket = next(self._tickets)
+        started = time.monotonic()
+        try:
+            with self._turn:
+                self._turn.wait_for(lambda: self._serving == ticket)
+            while True:
+                wait = self._try_take(tokens)
+                if not wait:
+                    break
+                time.sleep(wait)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        self._record(source, tokens, time.monotonic() - started)
+
+    async def a_acquire(self, tokens, source="judge"):
+        ticket = next(self._tickets)
+        started = time.monotonic()
+        turn = asyncio.Event()
+        with self._lock:
+            if self._serving != ticket:
+                self._waiters[ticket] = (asyncio.get_running_loop(), turn)
+            else:
+                turn.set()
+        try:
+            await turn.wait()
+            while True:
+                wait = self._try_take(tokens)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        finally:
+            with self._lock:
+                self._waiters.pop(ticket, None)
+        self._record(source, tokens, time.monotonic() - started)
+
+    def utilization(self):
+        # Share of each per-minute budget used over the last 60 seconds
+        now = time.monotonic()
+        with self._lock:
+            window = [(at, tokens) for at, tokens in self._window if now - at < 60]
+            return {
+                "requests": len(window) / self.requests_per_minute,
+                "tokens": sum(tokens for _, tokens in window) / self.tokens_per_minute,
+                "by_source": {source: dict(stats) for source, stats in self._stats.items()},
+            }
+
+
+_limiter = None
+
+
+def get_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        _limiter = TokenBucketRateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+    return _limiter
+
+
+class RateLimitCallback(BaseCallbackHandler):
+    # Pass to a LangChain LLM (callbacks=[RateLimitCallback("chain")]);
+    # on_llm_start runs before the request is sent, so blocking here throttles it
+    def __init__(self, source="chain"):
+        self.source = source
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        get_rate_limiter().acquire(sum(estimate_tokens(prompt) for prompt in prompts), self.source)
+
+
+def _limited_generate(generate, source):
+    @functools.wraps(generate)
+    def wrapper(self, prompt, *args, **kwargs):
+        get_rate_limiter().acquire(estimate_tokens(prompt), source)
+        return generate(self, prompt, *args, **kwargs)
+    return wrapper
+
+
+def _limited_a_generate(a_generate, source):
+    @functools.wraps(a_generate)
+    async def wrapper(self, prompt, *args, **kwargs):
+        await get_rate_limiter().a_acquire(estimate_tokens(prompt), source)
+        return await a_generate(self, prompt, *args, **kwargs)
+    return wrapper
+
+
+def install_rate_limiter(source="judge"):
+    # deepeval metrics and the Synthesizer both call GPTModel, so patching it
+    # puts every deepeval request behind the shared limiter
+    if getattr(GPTModel, "_rate_limiter_installed", False):
+        return
+    GPTModel.generate = _limited_generate(GPTModel.generate, source)
+    if hasattr(GPTModel, "a_generate"):
+        GPTModel.a_generate = _limited_a_generate(GPTModel.a_generate, source)
+    GPTModel._rate_limiter_installed = True
+
+
+def print_rate_limit_summary():
+    usage = get_rate_limiter().utilization()
+    print(f"Rate limiter: {usage['requests']:.0%} of RPM, {usage['tokens']:.0%} of TPM in the last minute")
+    for source, stats in usage["by_source"].items():
+        print(
+            f"  {source}: {stats['requests']} requests, ~{stats['tokens']} tokens, "
+            f"{stats['wait_seconds']:.1f}s waiting for budget"
+        )
@@ -0,0 +1,138 @@
+import glob
+import importlib
+import json
+import os
+import shutil
+import threading
+
+from judge_costs import cost_totals, merge_cost_totals
+
+# Every process appends its results here as JSONL the moment a test finishes,
+# one file per pytest-xdist worker ("main" outside xdist). The files are also
+# the shards the xdist controller merges; point it at a shared mount when
+# workers run on other machines.
+RESULTS_DIR = os.environ.get("DEEPEVAL_RESULTS_DIR", ".metric_results")
+
+_lock = threading.Lock()
+# True while the xdist controller imports a test module only for its report
+_report_only = False
+
+
+def _worker():
+    return os.environ.get("PYTEST_XDIST_WORKER", "main")
+
+
+def record_results(test_case, metrics, module=None):
+    # module is the recording test module's __name__: every test module writes
+    # to the same files, and each report only reads back its own rows
+    lines = []
+    for position, metric in enumerate(metrics):
+        # assert_test stops at the first metric that raises, later ones are never scored
+        if metric.score is None:
+            continue
+        lines.append(json.dumps([position, {
+            'Test Case': test_case.id,
+            'Metric': metric.__class__.__name__,
+            'Score': metric.score,
+            'Reason': metric.reason,
+            'Input': test_case.input,
+            'Actual Output': test_case.actual_output,
+            'Threshold': metric.threshold
+        }, module], default=str) + "\n")
+    # Appended and closed right away, so a crash keeps everything recorded so far
+    with _lock:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        with open(os.path.join(RESULTS_DIR, f"{_worker()}.jsonl"), "a") as file:
+            file.writelines(lines)
+
+
+def _iter_recorded():
+    # (metric position, row, recording module) of every worker, read back one line at a time
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.jsonl"))):
+        with open(path) as file:
+            for line in file:
+                # The last line can be cut short if the run was killed mid-write
+                try:
+                    position, row, recorded_by = json.loads(line)
+                except (json.JSONDecodeError, ValueError):
+                    continue
+                yield position, row, recorded_by
+
+
+def iter_entries(module=None):
+    # (metric position, row) pairs of every worker; only those recorded by
+    # module when one is given
+    for position, row, recorded_by in _iter_recorded():
+        if module is None or recorded_by == module:
+            yield position, row
+
+
+def recorded_modules():
+    # The test modules that recorded rows, in the order they first appear
+    return list(dict.fromkeys(recorded_by for _, _, recorded_by in _iter_recorded() if recorded_by))
+
+
+def stream_rows(reused=(), module=None):
+    # Grouped by metric like the old `for metric: for test_case:` report loop,
+    # test cases in the order they ran. One pass over the files per metric
+    # position keeps memory flat however large the dataset is.
+    positions = sorted({position for position, _ in reused} | {position for position, _ in iter_entries(module)})
+    for wanted in positions:
+        for position, row in reused:
+            if position == wanted:
+                yield row
+        for position, row in iter_entries(module):
+            if position == wanted:
+                yield row
+
+
+def write_shard():
+    # Written by each xdist worker when its session finishes (see conftest.py).
+    # Its rows are already on disk; the shard adds what its judge calls cost.
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, f"{_worker()}.json"), "w") as file:
+        json.dump({"judge_costs": cost_totals()}, file)
+
+
+def load_shards():
+    # Adds every worker's judge costs to this process's totals
+    for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json"))):
+        with open(path) as file:
+            shard = json.load(file)
+        merge_cost_totals(shard.get("judge_costs", []))
+
+
+def is_report_only():
+    return _report_only
+
+
+def import_for_report(module_name):
+    # The controller only needs the module's report functions; while it is
+    # imported here the module skips its installs, dataset and priming
+    global _report_only
+    _report_only = True
+    try:
+        return importlib.import_module(module_name)
+    finally:
+        _report_only = False
+
+
+def clear_results():
+    shutil.rmtree(RESULTS_DIR, ignore_errors=True)
+
+
+def write_html_table(file, rows, columns, table_id=None):
+    # Same markup as DataFrame.to_html(index=False, classes='table table-striped', escape=False),
+    # written one row at a time as the results stream in
+    id_attribute = f' id="{table_id}"' if table_id else ""
+    file.write(f'<table{id_attribute} border="1" class="dataframe table table-striped">\n')
+    file.write('  <thead>\n    <tr style="text-align: right;">\n')
+    for column in columns:
+        file.write(f"      <th>{column}</th>\n")
+    file.write("    </tr>\n  </thead>\n  <tbody>\n")
+    for row in rows:
+        file.write("    <tr>\n")
+        for column in columns:
+            file.write(f"      <td>{row.get(column)}</td>\n")
+        file.write("    </tr>\n")
+    file.write("  </tbody>\n</table>")
@@ -1,7 +1,6 @@
-from langchain import FAISS, PromptTemplate
+from langchain import PromptTemplate
 from langchain_openai import OpenAI
 from langchain_openai import OpenAIEmbeddings
-from langchain.document_loaders import PyPDFLoader
 from langchain.chains import RetrievalQA
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from deepeval import assert_test
@@ -11,6 +10,30 @@ import os
 import json
 import pandas as pd
 import matplotlib.pyplot as plt
+from context_verdicts import CONTEXT_VERDICTS, install_context_verdict_store, print_context_verdict_summary
+from metric_cache import install_verdict_cache, print_cache_summary
+from rate_limiter import RateLimitCallback, install_rate_limiter, print_rate_limit_summary
+from judge_costs import install_judge_cost_tracking, judge_cost_html
+from hedging import install_hedging, print_hedging_summary
+from vector_index import load_or_build_index
+from embedding_cache import CachedEmbeddings, print_embedding_cache_summary
+from answer_cache import answer, print_answer_cache_summary
+from tiered_judge import TIERED_JUDGE, install_tiered_judge, print_tier_summary
+
+# DEEPEVAL_CONTEXT_VERDICT_STORE=1 reuses per-context-sentence hallucination verdicts,
+# which sit behind the whole-metric verdict cache
+if CONTEXT_VERDICTS:
+    install_context_verdict_store()
+install_verdict_cache()
+# With DEEPEVAL_TIERED_JUDGE=1 the pinned model judges every case and only
+# scores near the threshold are re-judged by DEEPEVAL_STRONG_JUDGE (gpt-4)
+if TIERED_JUDGE:
+    install_tiered_judge()
+# Installed before the rate limiter so only the judge request itself is timed
+install_judge_cost_tracking()
+install_rate_limiter()
+# DEEPEVAL_HEDGE=1 / DEEPEVAL_CALL_DEADLINE=<seconds> turn on hedging and deadlines
+install_hedging()
 
 
 # Set the OpenAI API Key environment variable.
@@ -19,8 +42,8 @@ os.environ["OPENAI_API_KEY"] = "sk-C1yzofFKrLiwlZx3z8EeT3BlbkFJOuhx2VB0sR4mqeWvF
 
 # Prepare vector store (FAISS) with IPPC report
 text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100, add_start_index=True)
-loader = PyPDFLoader("DatasetCovid19.pdf")
-db = FAISS.from_documents(loader.load_and_split(text_splitter), OpenAIEmbeddings())
+# Loaded from .faiss_index/ when this PDF was already embedded with the same settings
+db = load_or_build_index("DatasetCovid19.pdf", text_splitter, CachedEmbeddings(OpenAIEmbeddings()))
 
 # Prepare QA chain
 PROMPT_TEMPLATE = """You are the Medical Assistant, a helpful AI assistant made by Giskard.
@@ -37,12 +60,12 @@ Question:
 Your answer:
 """
 
-llm = OpenAI(model="gpt-3.5-turbo-instruct", temperature=0)
+llm = OpenAI(model="gpt-3.5-turbo-instruct", temperature=0, callbacks=[RateLimitCallback("chain")])
 prompt = PromptTemplate(template=PROMPT_TEMPLATE, input_variables=["question", "context"])
 covid_qa_chain = RetrievalQA.from_llm(llm=llm, retriever=db.as_retriever(), prompt=prompt)
 
 # Test that everything works
-covid_qa_chain.run({"query": "When and why was a lockdown implemented in India?"})
+answer(covid_qa_chain, {"query": "When and why was a lockdown implemented in India?"})
 
 context = [
     "Coronaviruses are a large family of respiratory viruses that includes COVID-19, Middle East Respiratory Syndrome (MERS), and Severe Acute Respiratory Syndrome (SARS).",
@@ -74,11 +97,11 @@ input2 = "How many planets are there in the solar system?"  # Fail
 metric = HallucinationMetric(threshold=0.5, model="gpt-3.5-turbo", include_reason="true")
 test_case = LLMTestCase(
     input=input2,
-    actual_output=covid_qa_chain.run(input2),
+    actual_output=answer(covid_qa_chain, input2),
     context=context
 )
 assert_test(test_case, [metric])
-print(covid_qa_chain.run(input2))
+print(answer(covid_qa_chain, input2))
 print(metric.score)
 print(metric.reason)
 
@@ -245,6 +268,12 @@ def create_report(metric_results):
                             </tbody>
                         </table>
                     </section>
+        """)
+
+        # Evaluation cost of the judge itself
+        file.write(judge_cost_html())
+
+        file.write("""
                 </div>
                 <script src="https://code.jquery.com/jquery-3.5.1.slim.min.js"></script>
                 <script src="https://cdn.jsdelivr.net/npm/@popperjs/core@2.10.2/dist/umd/popper.min.js"></script>
@@ -255,3 +284,12 @@ def create_report(metric_results):
 
 # Call the function to create the report
 create_report([metric_results])
+print_cache_summary()
+if CONTEXT_VERDICTS:
+    print_context_verdict_summary()
+if TIERED_JUDGE:
+    print_tier_summary()
+print_rate_limit_summary()
+print_hedging_summary()
+print_embedding_cache_summary()
+print_answer_cache_summary()
@@ -1,14 +1,27 @@
 
-from langchain import FAISS, PromptTemplate
+from langchain import PromptTemplate
 from langchain_openai import OpenAI
 from langchain_openai import OpenAIEmbeddings
-from langchain.document_loaders import PyPDFLoader
 from langchain.chains import RetrievalQA
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from deepeval import assert_test
 from deepeval.metrics import  GEval, AnswerRelevancyMetric
 from deepeval.test_case import LLMTestCase,LLMTestCaseParams
 import os
+from metric_cache import install_verdict_cache, print_cache_summary
+from rate_limiter import RateLimitCallback, install_rate_limiter, print_rate_limit_summary
+from judge_costs import install_judge_cost_tracking, print_judge_cost_summary
+from hedging import install_hedging, print_hedging_summary
+from vector_index import load_or_build_index
+from embedding_cache import CachedEmbeddings, print_embedding_cache_summary
+from answer_cache import answer, print_answer_cache_summary
+
+install_verdict_cache()
+# Installed before the rate limiter so only the judge request itself is timed
+install_judge_cost_tracking()
+install_rate_limiter()
+# DEEPEVAL_HEDGE=1 / DEEPEVAL_CALL_DEADLINE=<seconds> turn on hedging and deadlines
+install_hedging()
 
 
 # Set the OpenAI API Key environment variable.
@@ -16,8 +29,8 @@ os.environ["OPENAI_API_KEY"] = "sk-C1yzofFKrLiwlZx3z8EeT3BlbkFJOuhx2VB0sR4mqeWvF
 
 # Prepare vector store (FAISS) with IPPC report
 text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100, add_start_index=True)
-loader = PyPDFLoader("DatasetCovid19.pdf")
-db = FAISS.from_documents(loader.load_and_split(text_splitter), OpenAIEmbeddings())
+# Loaded from .faiss_index/ when this PDF was already embedded with the same settings
+db = load_or_build_index("DatasetCovid19.pdf", text_splitter, CachedEmbeddings(OpenAIEmbeddings()))
 
 # Prepare QA chain
 PROMPT_TEMPLATE = """You are the Medical Assistant, a helpful AI assistant made by Giskard.
@@ -34,12 +47,12 @@ Question:
 Your answer:
 """
 
-llm = OpenAI(model="gpt-3.5-turbo-instruct", temperature=0)
+llm = OpenAI(model="gpt-3.5-turbo-instruct", temperature=0, callbacks=[RateLimitCallback("chain")])
 prompt = PromptTemplate(template=PROMPT_TEMPLATE, input_variables=["question", "context"])
 covid_qa_chain = RetrievalQA.from_llm(llm=llm, retriever=db.as_retriever(), prompt=prompt)
 
 # Test that everything works
-covid_qa_chain.run({"query": "When and why was a lockdown implemented in India?"})
+answer(covid_qa_chain, {"query": "When and why was a lockdown implemented in India?"})
 
 context= [
             "Coronaviruses are a large family of respiratory viruses that includes COVID-19, Middle East Respiratory Syndrome (MERS), and Severe Acute Respiratory Syndrome (SARS).",
@@ -66,13 +79,16 @@ input= "What are the symptoms of coronavirus?"
 metric = AnswerRelevancyMetric(threshold=0.5,model="gpt-3.5-turbo", include_reason="true")
 test_case = LLMTestCase(
         input=input,
-        actual_output=covid_qa_chain.run(input),
+        actual_output=answer(covid_qa_chain, input),
         retrieval_context=retrieval_context
     )
 assert_test(test_case, [metric])
-print(covid_qa_chain.run(input))
+print(answer(covid_qa_chain, input))
 print(metric.score)
 print(metric.reason)
-
-
-
+print_cache_summary()
+print_rate_limit_summary()
+print_hedging_summary()
+print_embedding_cache_summary()
+print_answer_cache_summary()
+print_judge_cost_summary()
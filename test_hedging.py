@@ -0,0 +1,121 @@
+import asyncio
+import http.server
+import threading
+import time
+import urllib.request
+
+import pytest
+
+import hedging
+
+# Seconds the local stand-in endpoint takes to answer: the latencies queued by
+# a test are used first, every later request gets FAST
+SLOW = 1.0
+FAST = 0.05
+HEDGE_DELAY = 0.15
+
+
+class _LatencyHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        with self.server.lock:
+            latency = self.server.latencies.pop(0) if self.server.latencies else FAST
+        time.sleep(latency)
+        body = f"{latency}".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _LatencyHandler)
+    server.daemon_threads = True
+    server.latencies = []
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def hedging_on(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGING", True)
+    monkeypatch.setattr(hedging, "HEDGE_INITIAL_DELAY", HEDGE_DELAY)
+    monkeypatch.setattr(hedging, "CALL_DEADLINE", 0.0)
+    hedging._latencies.clear()
+    hedging._stats.clear()
+
+
+def _get(server):
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/", timeout=10) as response:
+        return float(response.read())
+
+
+async def _a_get(server, completed):
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.server_port)
+    try:
+        writer.write(b"GET / HTTP/1.0\r\nHost: localhost\r\n\r\n")
+        await writer.drain()
+        response = await reader.read()
+    finally:
+        writer.close()
+    completed.append(response)
+    return float(response.split(b"\r\n\r\n", 1)[1])
+
+
+def test_hedge_wins_over_slow_primary(endpoint):
+    endpoint.latencies = [SLOW]
+    started = time.perf_counter()
+    assert hedging.hedged_call(_get, endpoint, source="test") == FAST
+    assert time.perf_counter() - started < SLOW
+
+    # The blocking primary runs on; the saving is measured once it finishes
+    time.sleep(SLOW)
+    stats = hedging._stats["test"]
+    assert (stats["calls"], stats["hedged"], stats["hedge_wins"]) == (1, 1, 1)
+    assert stats["saved_seconds"] > SLOW - HEDGE_DELAY - 0.2
+
+
+def test_fast_call_is_not_hedged(endpoint):
+    assert hedging.hedged_call(_get, endpoint, source="test") == FAST
+    assert hedging._stats["test"]["hedged"] == 0
+
+
+def test_async_hedge_cancels_slow_primary(endpoint):
+    endpoint.latencies = [SLOW]
+    completed = []
+
+    async def run():
+        started = time.perf_counter()
+        result = await hedging.a_hedged_call(_a_get, endpoint, completed, source="test")
+        elapsed = time.perf_counter() - started
+        # Give a primary that was not cancelled the time to finish
+        await asyncio.sleep(SLOW)
+        return result, elapsed
+
+    result, elapsed = asyncio.run(run())
+    assert result == FAST
+    assert elapsed < SLOW
+    # Only the hedge's response was read, the primary was cancelled
+    assert len(completed) == 1
+    # and only the hedge's latency was recorded
+    assert len(hedging._latencies["test"]) == 1
+    stats = hedging._stats["test"]
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+    assert stats["saved_seconds"] > 0
+
+
+def test_deadline(endpoint, monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGING", False)
+    monkeypatch.setattr(hedging, "CALL_DEADLINE", 0.3)
+    endpoint.latencies = [SLOW, SLOW]
+    with pytest.raises(TimeoutError):
+        hedging.hedged_call(_get, endpoint, source="test")
+    with pytest.raises(TimeoutError):
+        asyncio.run(hedging.a_hedged_call(_a_get, endpoint, [], source="test"))
+    assert hedging._stats["test"]["timeouts"] == 2
@@ -2,6 +2,13 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from deepeval.metrics import HallucinationMetric, BiasMetric, LatencyMetric, CostMetric
 from deepeval.test_case import LLMTestCase
+from eval_engine import measure_metrics_concurrently
+from metric_directions import add_status
+from metric_cache import install_verdict_cache, print_cache_summary
+from rate_limiter import install_rate_limiter, print_rate_limit_summary
+
+install_verdict_cache()
+install_rate_limiter()
 
 def create_test_case():
     return LLMTestCase(
@@ -23,28 +30,24 @@ def measure_metrics(test_cases):
 
     metric_results = []
 
-    for metric in metrics:
-        for test_case in test_cases:
-            metric.measure(test_case)
-            metric_results.append({
-                'Test Case': test_case.id,
-                'Metric': metric.__class__.__name__,
-                'Score': metric.score,
-                'Reason': metric.reason,
-                'Input': test_case.input,
-                'Actual Output': test_case.actual_output,
-                'Context': ', '.join(test_case.context),
-                'Status': 'Pass' if metric.score > 0.5 else 'Fail'
-            })
-
-    return metric_results
+    # Imported by pytest, so the checkpoint is named after the module rather than the runner
+    for metric, test_case in measure_metrics_concurrently(metrics, test_cases, namespace=__name__):
+        metric_results.append({
+            'Test Case': test_case.id,
+            'Metric': metric.__class__.__name__,
+            'Score': metric.score,
+            'Reason': metric.reason,
+            'Input': test_case.input,
+            'Actual Output': test_case.actual_output,
+            'Context': ', '.join(test_case.context),
+            'Threshold': metric.threshold
+        })
+
+    return add_status(metric_results)
 
 def create_pie_chart(metric_results):
     df = pd.DataFrame(metric_results)
 
-    # Determine pass/fail status based on some condition (you can customize this)
-    df['Status'] = df['Score'] > 0.5  # Change the condition as needed
-
     # Count pass and fail values
     pass_fail_counts = df['Status'].value_counts()
 
@@ -368,6 +371,8 @@ def main():
     metric_results = measure_metrics([test_case])
     create_pie_chart(metric_results)
     log_report_table(metric_results)
+    print_cache_summary()
+    print_rate_limit_summary()
 
 if __name__ == "__main__":
     main()
@@ -7,6 +7,7 @@ import pytest
 import json
 import pandas as pd
 import matplotlib.pyplot as plt
+from metric_directions import add_status
 
 # Assuming EvaluationDataset and other necessary classes are imported properly
 
@@ -82,9 +83,9 @@ def test_customer_chatbot(test_case: LLMTestCase):
                 'Input': test_case.input,
                 'Actual Output': test_case.actual_output,
                 'Context': ', '.join(test_case.context),
-                'Status': 'Pass' if metric.score > 0.5 else 'Fail'
+                'Threshold': metric.threshold
             })
-    return metric_results
+    return add_status(metric_results)
 
 
 
@@ -102,8 +103,8 @@ def function_to_be_called_after_test_run():
 def create_pie_chart(metric_results):
     df = pd.DataFrame(metric_results)
 
-    # Determine pass/fail status based on some condition (you can customize this)
-    df['Status'] = df['Score'] > 0.5  # Change the condition as needed
+    # Pass/Fail against each metric's own threshold and direction
+    df = add_status(df)
 
     # Count pass and fail values
     pass_fail_counts = df['Status'].value_counts()
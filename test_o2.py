@@ -1,21 +1,42 @@
+from collections import Counter
 import deepeval
 from deepeval.dataset import EvaluationDataset
 from deepeval import assert_test
 from deepeval.metrics import HallucinationMetric, BiasMetric, LatencyMetric, CostMetric
 from deepeval.test_case import LLMTestCase
+from eval_engine import gate_metrics
+from result_collector import record_results, is_report_only, stream_rows, write_html_table
+from metric_directions import stream_status
 import pytest
 import json
 import pandas as pd
 import matplotlib.pyplot as plt
+from context_verdicts import CONTEXT_VERDICTS, install_context_verdict_store, print_context_verdict_summary
+from metric_cache import install_verdict_cache, print_cache_summary
+from judge_costs import install_judge_cost_tracking, judge_cost_html
+from rate_limiter import install_rate_limiter, print_rate_limit_summary
+
+# The xdist controller imports this module only to build its report (see conftest.py)
+if not is_report_only():
+    # DEEPEVAL_CONTEXT_VERDICT_STORE=1 reuses per-context-sentence hallucination verdicts,
+    # which sit behind the whole-metric verdict cache
+    if CONTEXT_VERDICTS:
+        install_context_verdict_store()
+    install_verdict_cache()
+    # Installed before the rate limiter so only the judge request itself is timed
+    install_judge_cost_tracking()
+    install_rate_limiter()
 
 # Assuming EvaluationDataset and other necessary classes are imported properly
 
 # Instantiate your EvaluationDataset
 dataset = EvaluationDataset()
 
-# Read the JSON file
-with open('D:/vsfiles/medicalDataset.json', 'r') as f:
-    data = json.load(f)
+# Read the JSON file; the report alone needs no dataset
+data = {'entrie': []}
+if not is_report_only():
+    with open('D:/vsfiles/medicalDataset.json', 'r') as f:
+        data = json.load(f)
 
 # Access the entries
 entries = data['entrie']
@@ -62,52 +83,33 @@ def test_customer_chatbot(test_case: LLMTestCase):
     bias_metric = BiasMetric(threshold=0.2)
     latency_metric = LatencyMetric(max_latency=0.5)
     cost_metric = CostMetric(max_cost=10)
-    assert_test(test_case, [hallucination_metric, bias_metric, latency_metric, cost_metric])
+    # With DEEPEVAL_FAIL_FAST=1 the Latency/Cost gates run first and a case that fails them is not judged
+    metrics = gate_metrics(test_case, [hallucination_metric, bias_metric, latency_metric, cost_metric])
+    try:
+        assert_test(test_case, metrics)
+    finally:
+        record_results(test_case, metrics, __name__)
 
 
 @deepeval.on_test_run_end
 def function_to_be_called_after_test_run():
-    metric_results = []
-    metrics = [
-        HallucinationMetric(threshold=0.7),
-        BiasMetric(threshold=0.2),
-        LatencyMetric(max_latency=0.5),
-        CostMetric(max_cost=10)
-    ]
-
-    for metric in metrics:
-        for test_case in dataset:
-            metric.measure(test_case)
-
-            if isinstance(metric, (BiasMetric, LatencyMetric, CostMetric)):
-                # For BiasMetric, LatencyMetric, and CostMetric, use a different Pass/Fail logic
-                status = 'Pass' if metric.score <= metric.threshold else 'Fail'
-            else:
-                # For other metrics, use the threshold-based Pass/Fail logic
-                status = 'Pass' if metric.score > metric.threshold else 'Fail'
-
-            metric_results.append({
-                'Test Case': test_case.id,
-                'Metric': metric.__class__.__name__,
-                'Score': metric.score,
-                'Reason': metric.reason,
-                'Input': test_case.input,
-                'Actual Output': test_case.actual_output,
-                # 'Context': ', '.join(test_case.context),
-                'Status': status
-            })
-
+    # Every metric was already scored by assert_test in test_customer_chatbot,
+    # so the report is built from those results without new judge calls. Both
+    # stream them back from disk instead of holding every row in memory.
     # Create and save pie chart
-    create_pie_chart(metric_results)
+    create_pie_chart(stream_status(stream_rows(module=__name__)))
 
     # Create and save HTML report
-    log_report_table(metric_results)
+    log_report_table(stream_status(stream_rows(module=__name__)))
     print("Test finished!")
+    print_cache_summary()
+    if CONTEXT_VERDICTS:
+        print_context_verdict_summary()
+    print_rate_limit_summary()
 
 # Adding reporting functionality
 def create_pie_chart(metric_results):
-    df = pd.DataFrame(metric_results)
-    pass_fail_counts = df['Status'].value_counts()
+    pass_fail_counts = pd.Series(Counter(row['Status'] for row in metric_results)).sort_values(ascending=False)
 
     # Custom colors for Pass (green) and Fail (red)
     colors = ['#4CAF50', '#FF0000']
@@ -132,7 +134,6 @@ def create_pie_chart(metric_results):
 
 def log_report_table(metrics_results):
     table_columns = ['Test Case', 'Metric', 'Score', 'Reason', 'Input', 'Actual Output', 'Status']
-    report_df = pd.DataFrame(metrics_results, columns=table_columns)
 
     with open("metricsTables_report.html", "w") as file:
         file.write("""
@@ -211,7 +212,7 @@ def log_report_table(metrics_results):
                     <h2 class="mt-4">Test Results &#128202</h2>
                     """)
 
-        file.write(report_df.to_html(index=False, classes='table table-striped', escape=False))
+        write_html_table(file, metrics_results, table_columns)
 
         file.write("""
                 </section>
@@ -219,6 +220,12 @@ def log_report_table(metrics_results):
                     <h2 class="mt-4">Pass/Fail Distribution</h2>
                     <img src='pie_chart_3d.png' alt='Pass/Fail Distribution' class="img-fluid">
                 </section>
+        """)
+
+        # Evaluation cost of the judge itself
+        file.write(judge_cost_html())
+
+        file.write("""
             </div>
             <script src="https://code.jquery.com/jquery-3.5.1.slim.min.js"></script>
             <script src="https://cdn.jsdelivr.net/npm/@popperjs/core@2.10.2/dist/umd/popper.min.js"></script>
@@ -0,0 +1,156 @@
+import asyncio
+import http.server
+import threading
+import time
+import urllib.request
+
+import pytest
+from deepeval.models import GPTModel
+
+import rate_limiter
+from rate_limiter import TokenBucketRateLimiter
+
+# Budget of the limiter under test: each request estimates to PROMPT_TOKENS
+# tokens, so once the token bucket is drained one request goes out per GAP seconds
+REQUESTS_PER_MINUTE = 6000
+TOKENS_PER_MINUTE = 60000
+PROMPT_TOKENS = 100
+GAP = PROMPT_TOKENS * 60 / TOKENS_PER_MINUTE
+
+
+class _RecordingHandler(http.server.BaseHTTPRequestHandler):
+    # Local stand-in for the judge endpoint: records which request arrived when
+    def do_POST(self):
+        prompt = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        with self.server.lock:
+            self.server.arrivals.append((time.monotonic(), int(prompt.split(":")[0])))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def endpoint():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RecordingHandler)
+    server.daemon_threads = True
+    server.arrivals = []
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def model(endpoint, monkeypatch):
+    # GPTModel's requests go to the local endpoint, behind a fresh limiter
+    # installed the way the test scripts do it
+    def generate(self, prompt, *args, **kwargs):
+        request = urllib.request.Request(f"http://127.0.0.1:{endpoint.server_port}/", data=prompt.encode())
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.read().decode()
+
+    async def a_generate(self, prompt, *args, **kwargs):
+        reader, writer = await asyncio.open_connection("127.0.0.1", endpoint.server_port)
+        try:
+            body = prompt.encode()
+            writer.write(b"POST / HTTP/1.0\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+            await writer.drain()
+            response = await reader.read()
+        finally:
+            writer.close()
+        return response.split(b"\r\n\r\n", 1)[1].decode()
+
+    monkeypatch.setattr(GPTModel, "generate", generate, raising=False)
+    monkeypatch.setattr(GPTModel, "a_generate", a_generate, raising=False)
+    monkeypatch.setattr(GPTModel, "_rate_limiter_installed", False, raising=False)
+    monkeypatch.setattr(rate_limiter, "COMPLETION_TOKENS", 0)
+    monkeypatch.setattr(rate_limiter, "_limiter", TokenBucketRateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE))
+    rate_limiter.install_rate_limiter()
+    return GPTModel.__new__(GPTModel)
+
+
+@pytest.fixture
+def drained_limiter(model, monkeypatch):
+    # Takes the whole token budget, so every later request waits for its refill.
+    # _try_take is counted: queued callers must sleep until handed the turn.
+    limiter = rate_limiter.get_rate_limiter()
+    limiter.acquire(TOKENS_PER_MINUTE, source="drain")
+    limiter.checks = 0
+    try_take = limiter._try_take
+
+    def counted(tokens):
+        limiter.checks += 1
+        return try_take(tokens)
+
+    monkeypatch.setattr(limiter, "_try_take", counted)
+    return limiter
+
+
+def _prompt(index):
+    prompt = f"{index}:"
+    return prompt + "x" * (PROMPT_TOKENS * 4 - len(prompt))
+
+
+def _assert_paced(endpoint, expected):
+    times = [at for at, _ in endpoint.arrivals]
+    assert [index for _, index in endpoint.arrivals] == expected
+    assert all(later - earlier > GAP * 0.8 for earlier, later in zip(times, times[1:]))
+
+
+def test_threads_are_paced_in_arrival_order(endpoint, model, drained_limiter):
+    threads = []
+    for index in range(5):
+        threads.append(threading.Thread(target=GPTModel.generate, args=(model, _prompt(index))))
+        threads[-1].start()
+        # Lets each thread take its ticket before the next one starts
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+
+    _assert_paced(endpoint, list(range(5)))
+    # One check for the wait and one to take the budget, give or take rounding
+    assert drained_limiter.checks <= 3 * 5
+    assert drained_limiter.utilization()["by_source"]["judge"]["requests"] == 5
+
+
+def test_coroutines_are_paced_in_arrival_order(endpoint, model, drained_limiter):
+    async def run():
+        return await asyncio.gather(*[model.a_generate(_prompt(index)) for index in range(5)])
+
+    assert asyncio.run(run()) == ["ok"] * 5
+    _assert_paced(endpoint, list(range(5)))
+    assert drained_limiter.checks <= 3 * 5
+
+
+def test_cancelled_waiter_hands_off_its_turn(endpoint, model, drained_limiter):
+    async def run():
+        tasks = [asyncio.create_task(model.a_generate(_prompt(index))) for index in range(3)]
+        await asyncio.sleep(GAP / 2)
+        tasks[1].cancel()
+        await asyncio.gather(tasks[0], tasks[2])
+
+    started = time.monotonic()
+    asyncio.run(run())
+    _assert_paced(endpoint, [0, 2])
+    # The third request went out right after the first, not after a skipped slot
+    assert time.monotonic() - started < GAP * 3
+
+
+def test_thread_and_coroutines_share_the_queue(endpoint, model, drained_limiter):
+    async def run():
+        first = asyncio.create_task(model.a_generate(_prompt(0)))
+        await asyncio.sleep(0.01)
+        # Queued from another thread between two coroutines of this loop
+        second = asyncio.create_task(asyncio.to_thread(GPTModel.generate, model, _prompt(1)))
+        await asyncio.sleep(0.01)
+        third = asyncio.create_task(model.a_generate(_prompt(2)))
+        await asyncio.gather(first, second, third)
+
+    asyncio.run(run())
+    _assert_paced(endpoint, [0, 1, 2])
+    assert drained_limiter.checks <= 3 * 3
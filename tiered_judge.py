@@ -0,0 +1,119 @@
+import copy
+import functools
+import os
+import threading
+import time
+
+from deepeval.models import GPTModel
+
+from metric_cache import CACHED_METRICS
+
+# Off by default; DEEPEVAL_TIERED_JUDGE=1 re-judges only borderline cases with the strong model
+TIERED_JUDGE = os.environ.get("DEEPEVAL_TIERED_JUDGE", "0") == "1"
+
+# The cheap tier is the model the metric was built with unless overridden here
+CHEAP_JUDGE = os.environ.get("DEEPEVAL_CHEAP_JUDGE")
+STRONG_JUDGE = os.environ.get("DEEPEVAL_STRONG_JUDGE", "gpt-4")
+
+# A cheap score within this distance of the threshold is escalated to the strong judge
+ESCALATION_BAND = float(os.environ.get("DEEPEVAL_ESCALATION_BAND", "0.1"))
+
+_models = {}
+_stats = {
+    "cheap": {"calls": 0, "seconds": 0.0},
+    "strong": {"calls": 0, "seconds": 0.0},
+}
+_lock = threading.Lock()
+
+
+def _model(name):
+    with _lock:
+        if name not in _models:
+            _models[name] = GPTModel(model=name)
+        return _models[name]
+
+
+def _tier_copy(metric, tier):
+    # The copy carries the tier's model, so the verdict cache, fused judge and
+    # context verdict store all key their results by the model that produced them
+    judged = copy.copy(metric)
+    judged._judge_tier = tier
+    name = STRONG_JUDGE if tier == "strong" else CHEAP_JUDGE
+    if name:
+        judged.model = _model(name)
+        judged.evaluation_model = name
+    return judged
+
+
+def _record(tier, started):
+    with _lock:
+        _stats[tier]["calls"] += 1
+        _stats[tier]["seconds"] += time.perf_counter() - started
+
+
+def _adopt(metric, judged):
+    metric.score = judged.score
+    metric.reason = judged.reason
+    metric.success = getattr(judged, "success", None)
+
+
+def needs_escalation(metric):
+    return metric.score is not None and abs(metric.score - metric.threshold) <= ESCALATION_BAND
+
+
+def _tiered_measure(measure):
+    @functools.wraps(measure)
+    def wrapper(self, test_case, *args, **kwargs):
+        # Calls made from inside a tier (e.g. measure() running a_measure) pass straight through
+        if getattr(self, "_judge_tier", None):
+            return measure(self, test_case, *args, **kwargs)
+        for tier in ("cheap", "strong"):
+            judged = _tier_copy(self, tier)
+            started = time.perf_counter()
+            measure(judged, test_case, *args, **kwargs)
+            _record(tier, started)
+            _adopt(self, judged)
+            if not needs_escalation(judged):
+                break
+        return self.score
+    return wrapper
+
+
+def _tiered_a_measure(a_measure):
+    @functools.wraps(a_measure)
+    async def wrapper(self, test_case, *args, **kwargs):
+        if getattr(self, "_judge_tier", None):
+            return await a_measure(self, test_case, *args, **kwargs)
+        for tier in ("cheap", "strong"):
+            judged = _tier_copy(self, tier)
+            started = time.perf_counter()
+            await a_measure(judged, test_case, *args, **kwargs)
+            _record(tier, started)
+            _adopt(self, judged)
+            if not needs_escalation(judged):
+                break
+        return self.score
+    return wrapper
+
+
+def install_tiered_judge():
+    # Wraps whatever measure is installed at this point, so call it after
+    # install_verdict_cache(): each tier's verdict is then cached under its own model
+    for metric_class in CACHED_METRICS:
+        if getattr(metric_class, "_tiered_judge_installed", False):
+            continue
+        metric_class.measure = _tiered_measure(metric_class.measure)
+        if hasattr(metric_class, "a_measure"):
+            metric_class.a_measure = _tiered_a_measure(metric_class.a_measure)
+        metric_class._tiered_judge_installed = True
+
+
+def print_tier_summary():
+    with _lock:
+        stats = {tier: dict(values) for tier, values in _stats.items()}
+    for tier, values in stats.items():
+        average = values["seconds"] / values["calls"] if values["calls"] else 0.0
+        print(
+            f"Judge tier {tier} ({STRONG_JUDGE if tier == 'strong' else CHEAP_JUDGE or 'metric model'}): "
+            f"{values['calls']} calls, {values['seconds']:.1f}s total, {average:.2f}s average"
+        )
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+
+from langchain import FAISS
+from langchain.document_loaders import PyPDFLoader
+
+from embedding_cache import embedding_model
+from profiling import span
+
+# One subdirectory per (PDF path, splitter settings, embedding model), holding
+# the index.faiss/index.pkl pair FAISS.save_local writes and a manifest of the
+# page and chunk hashes it was built from
+INDEX_DIR = os.environ.get("DEEPEVAL_INDEX_DIR", ".faiss_index")
+
+# New chunks are embedded and added to the index this many at a time, while
+# the next pages are still being parsed
+EMBEDDING_BATCH_SIZE = int(os.environ.get("DEEPEVAL_EMBEDDING_BATCH_SIZE", "64"))
+
+_DONE = object()
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_id(document):
+    # Pages and chunks are identified by their text and metadata (page number,
+    # start index), which is also the docstore id each chunk is stored under
+    return hashlib.sha256(
+        json.dumps([document.page_content, document.metadata], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def splitter_settings(text_splitter):
+    return {
+        "splitter": type(text_splitter).__name__,
+        "chunk_size": getattr(text_splitter, "_chunk_size", None),
+        "chunk_overlap": getattr(text_splitter, "_chunk_overlap", None),
+        "add_start_index": getattr(text_splitter, "_add_start_index", None),
+    }
+
+
+def index_key(pdf_path, text_splitter, embeddings):
+    # Editing the PDF keeps its index, which is then updated in place;
+    # different splitter settings or embeddings get an index of their own
+    return hashlib.sha256(json.dumps({
+        "pdf": os.path.abspath(pdf_path),
+        "splitter": splitter_settings(text_splitter),
+        "embeddings": embedding_model(embeddings),
+    }, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _load(directory, embeddings):
+    # index.pkl is a pickle; only indexes this module wrote are ever loaded
+    try:
+        return FAISS.load_local(directory, embeddings, allow_dangerous_deserialization=True)
+    except TypeError:
+        # langchain releases before the flag was added load pickles unconditionally
+        return FAISS.load_local(directory, embeddings)
+
+
+def _load_manifest(directory):
+    path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(os.path.join(directory, "index.faiss")) or not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def _save(db, manifest, directory):
+    # Written next to its final place and renamed in, so a run killed mid-save
+    # or a concurrent xdist worker never leaves a half-written index behind
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=INDEX_DIR, prefix=".building-")
+    db.save_local(staging)
+    with open(os.path.join(staging, "manifest.json"), "w") as file:
+        json.dump(manifest, file)
+    # rename cannot replace a non-empty directory, the outdated index is moved aside first
+    retired = staging + "-retired"
+    try:
+        os.rename(directory, retired)
+    except OSError:
+        pass
+    try:
+        os.rename(staging, directory)
+    except OSError:
+        # Another process saved its index first
+        shutil.rmtree(staging, ignore_errors=True)
+    shutil.rmtree(retired, ignore_errors=True)
+
+
+def iter_pages(pdf_path):
+    # One page at a time, parsed only when the consumer asks for it
+    pages = PyPDFLoader(pdf_path).lazy_load()
+    while True:
+        with span("pdf_load"):
+            page = next(pages, None)
+        if page is None:
+            return
+        yield page
+
+
+def iter_new_chunks(pages, text_splitter, known, page_chunks):
+    # (chunk id, chunk) for every chunk not in the index yet. Pages in known
+    # are not split again; page_chunks collects each page's chunk ids in page
+    # order as the pages stream past.
+    stored = {chunk_id for chunk_ids in known.values() for chunk_id in chunk_ids}
+    for page in pages:
+        page_id = document_id(page)
+        if page_id in page_chunks:
+            continue
+        if page_id in known:
+            page_chunks[page_id] = known[page_id]
+            continue
+        with span("split"):
+            chunks = text_splitter.split_documents([page])
+        page_chunks[page_id] = [document_id(chunk) for chunk in chunks]
+        for chunk_id, chunk in zip(page_chunks[page_id], chunks):
+            if chunk_id not in stored:
+                stored.add(chunk_id)
+                yield chunk_id, chunk
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prefetch(items, depth=2):
+    # Runs the items generator on a background thread, at most depth items
+    # ahead of the consumer, so parsing overlaps with embedding
+    ready = queue.Queue(maxsize=depth)
+
+    def produce():
+        try:
+            for item in items:
+                ready.put((item, None))
+        except BaseException as error:
+            ready.put((_DONE, error))
+            return
+        ready.put((_DONE, None))
+
+    threading.Thread(target=produce, name="pdf-ingest", daemon=True).start()
+    while True:
+        item, error = ready.get()
+        if item is _DONE:
+            if error is not None:
+                raise error
+            return
+        yield item
+
+
+def _add(db, batch, embeddings):
+    # Embeds one batch and writes it to the index, creating the index with the first batch
+    chunks = [chunk for _, chunk in batch]
+    texts = [chunk.page_content for chunk in chunks]
+    with span("embed"):
+        vectors = embeddings.embed_documents(texts)
+    with span("faiss_add"):
+        text_embeddings = list(zip(texts, vectors))
+        metadatas = [chunk.metadata for chunk in chunks]
+        ids = [chunk_id for chunk_id, _ in batch]
+        if db is None:
+            return FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+        db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    return db
+
+
+def load_or_build_index(pdf_path, text_splitter, embeddings):
+    # Drop-in for FAISS.from_documents(PyPDFLoader(pdf_path).load_and_split(text_splitter), embeddings).
+    # An unchanged PDF is loaded as is; after an edit only the chunks of
+    # changed pages are embedded and chunks that disappeared are removed.
+    directory = os.path.join(INDEX_DIR, index_key(pdf_path, text_splitter, embeddings))
+    pdf_hash = _file_hash(pdf_path)
+    manifest = _load_manifest(directory)
+    if manifest is not None and manifest["pdf"] == pdf_hash:
+        with span("faiss_load"):
+            return _load(directory, embeddings)
+
+    # DEEPEVAL_PROFILE=1 times each stage (see profiling.py)
+    known = dict(manifest["pages"]) if manifest is not None else {}
+    db = _load(directory, embeddings) if manifest is not None else None
+    page_chunks = {}
+    chunks = iter_new_chunks(iter_pages(pdf_path), text_splitter, known, page_chunks)
+    for batch in prefetch(iter_batches(chunks, EMBEDDING_BATCH_SIZE)):
+        db = _add(db, batch, embeddings)
+
+    # page_chunks is complete once the stream is exhausted
+    kept = {chunk_id for chunk_ids in page_chunks.values() for chunk_id in chunk_ids}
+    removed = [chunk_id for chunk_ids in known.values() for chunk_id in chunk_ids if chunk_id not in kept]
+    if removed:
+        with span("faiss_delete"):
+            db.delete(list(dict.fromkeys(removed)))
+    _save(db, {"pdf": pdf_hash, "pages": list(page_chunks.items())}, directory)
+    return db